@@ -0,0 +1,65 @@
+"""
+Archive of raw search-result pages, for offline replay (python main.py --replay).
+
+Pages are stored gzip-compressed and content-addressed by SHA-256 under
+archive/objects/, so a page that did not change between cycles is stored
+once. Each cycle writes a small manifest under archive/cycles/ listing which
+object was fetched for which page, and when.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from config import ARCHIVE_DIR
+
+
+def _object_path(sha: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, "objects", sha[:2], f"{sha}.gz")
+
+
+def new_manifest() -> dict:
+    return {"started": time.time(), "pages": []}
+
+
+def record_page(manifest: dict, page: int, content: bytes) -> None:
+    """Store a page (deduplicated) and note it in the cycle manifest."""
+    sha = hashlib.sha256(content).hexdigest()
+    path = _object_path(sha)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    manifest["pages"].append({"page": page, "sha": sha, "fetched_at": time.time()})
+
+
+def save_manifest(manifest: dict) -> None:
+    if not manifest["pages"]:
+        return
+    directory = os.path.join(ARCHIVE_DIR, "cycles")
+    os.makedirs(directory, exist_ok=True)
+    name = datetime.fromtimestamp(manifest["started"]).strftime("%Y%m%d-%H%M%S-%f")
+    with open(os.path.join(directory, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def iter_cycles(archive_dir: str = ARCHIVE_DIR):
+    """Yield cycle manifests, oldest first."""
+    directory = os.path.join(archive_dir, "cycles")
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                yield json.load(f)
+
+
+def load_page(sha: str, archive_dir: str = ARCHIVE_DIR) -> bytes:
+    with gzip.open(_object_path(sha, archive_dir), "rb") as f:
+        return f.read()
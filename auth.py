@@ -9,11 +9,14 @@ as the COOKIES_JSON config var:
 
 Usage:
     python main.py --login
+
+When CROUS_EMAIL / CROUS_PASSWORD are set, login_headless() can renew the
+cookies without a browser window (used by session_manager.py).
 """
 
 import json
 import os
-from config import BASE_URL, COOKIES_FILE, HEROKU_API_KEY, HEROKU_APP_NAME
+from config import BASE_URL, COOKIES_FILE, LOGIN_URL, HEROKU_API_KEY, HEROKU_APP_NAME
 
 
 def _write_cookies_to_heroku(payload: str) -> None:
@@ -46,6 +49,15 @@ def ensure_cookies_file() -> None:
             f.write(raw)
 
 
+def _save_cookies(cookies: list[dict], push_to_heroku: bool = True) -> None:
+    payload = json.dumps(cookies, indent=2)
+    with open(COOKIES_FILE, "w", encoding="utf-8") as f:
+        f.write(payload)
+    print(f"✅ Cookies saved to {COOKIES_FILE}")
+    if push_to_heroku:
+        _write_cookies_to_heroku(payload)
+
+
 def login_and_save_cookies() -> None:
     from playwright.sync_api import sync_playwright
     print("Opening browser for login — please complete the authentication in the browser window.")
@@ -56,7 +68,7 @@ def login_and_save_cookies() -> None:
         context = browser.new_context()
         page = context.new_page()
 
-        page.goto(f"{BASE_URL}/mse/discovery/connect")
+        page.goto(LOGIN_URL)
 
         # Wait until the user is redirected back to the CROUS site after login
         page.wait_for_url(f"{BASE_URL}/**", timeout=300_000)
@@ -64,10 +76,31 @@ def login_and_save_cookies() -> None:
         cookies = context.cookies()
         browser.close()
 
-    payload = json.dumps(cookies, indent=2)
-    with open(COOKIES_FILE, "w", encoding="utf-8") as f:
-        f.write(payload)
-
-    print(f"✅ Cookies saved to {COOKIES_FILE}")
+    _save_cookies(cookies)
     print("Set USE_AUTH=true in your .env to use them.")
-    _write_cookies_to_heroku(payload)
+
+
+def login_headless(email: str, password: str, login_url: str = LOGIN_URL,
+                   success_url: str = f"{BASE_URL}/**") -> None:
+    """Log in without a visible browser by filling the login form, then save cookies.
+
+    login_url / success_url can point at a local mock login page for testing.
+    Cookies are not pushed to Heroku: the config var PATCH would restart the dyno.
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            context = browser.new_context()
+            page = context.new_page()
+            page.goto(login_url)
+            page.fill('input[type="email"], input[name="username"], input[name="email"]', email)
+            page.fill('input[type="password"]', password)
+            page.click('button[type="submit"], input[type="submit"]')
+            page.wait_for_url(success_url, timeout=60_000)
+            cookies = context.cookies()
+        finally:
+            browser.close()
+
+    _save_cookies(cookies, push_to_heroku=False)
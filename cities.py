@@ -0,0 +1,181 @@
+"""
+In-memory city catalogue for the settings page.
+
+Built once from cities.txt, then merged with the live city stats scraped
+from the CROUS site (postal code + listing count per city). The full /cities
+payload and its ETag are precomputed whenever the index changes, so serving
+the list is a dict lookup; search() returns only the top matches.
+"""
+
+import difflib
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+
+CITIES_FILE = "cities.txt"
+
+# Département code → région (2016 regions + overseas)
+_REGIONS: dict[str, tuple[str, ...]] = {
+    "Auvergne-Rhône-Alpes": ("01", "03", "07", "15", "26", "38", "42", "43", "63", "69", "73", "74"),
+    "Bourgogne-Franche-Comté": ("21", "25", "39", "58", "70", "71", "89", "90"),
+    "Bretagne": ("22", "29", "35", "56"),
+    "Centre-Val de Loire": ("18", "28", "36", "37", "41", "45"),
+    "Corse": ("2A", "2B"),
+    "Grand Est": ("08", "10", "51", "52", "54", "55", "57", "67", "68", "88"),
+    "Hauts-de-France": ("02", "59", "60", "62", "80"),
+    "Île-de-France": ("75", "77", "78", "91", "92", "93", "94", "95"),
+    "Normandie": ("14", "27", "50", "61", "76"),
+    "Nouvelle-Aquitaine": ("16", "17", "19", "23", "24", "33", "40", "47", "64", "79", "86", "87"),
+    "Occitanie": ("09", "11", "12", "30", "31", "32", "34", "46", "48", "65", "66", "81", "82"),
+    "Pays de la Loire": ("44", "49", "53", "72", "85"),
+    "Provence-Alpes-Côte d'Azur": ("04", "05", "06", "13", "83", "84"),
+    "Guadeloupe": ("971",),
+    "Martinique": ("972",),
+    "Guyane": ("973",),
+    "La Réunion": ("974",),
+    "Mayotte": ("976",),
+}
+_DEPT_TO_REGION = {dept: region for region, depts in _REGIONS.items() for dept in depts}
+
+_lock = threading.Lock()
+_loaded = False
+_static: set[str] = set()
+_live: dict[str, dict] = {}          # display name → {"postcode": str | None, "count": int}
+_by_norm: dict[str, str] = {}        # normalized name → display name
+_payload: bytes = b""
+_etag: str = ""
+
+
+def normalize(name: str) -> str:
+    """Uppercase, strip accents and collapse separators: 'Saint-Étienne' → 'SAINT ETIENNE'."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"[\s\-'’]+", " ", stripped).strip().upper()
+
+
+def departement(postcode: str | None) -> str | None:
+    """Map a 5-digit postal code to its département code ('20090' → '2A')."""
+    if not postcode or len(postcode) != 5 or not postcode.isdigit():
+        return None
+    if postcode.startswith("97"):
+        return postcode[:3]
+    if postcode.startswith("20"):
+        return "2A" if int(postcode) < 20200 else "2B"
+    return postcode[:2]
+
+
+def region(postcode: str | None) -> str | None:
+    return _DEPT_TO_REGION.get(departement(postcode) or "")
+
+
+def _load_static() -> None:
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(CITIES_FILE, encoding="utf-8") as f:
+            for line in f:
+                c = line.strip()
+                if c:
+                    _static.add(c)
+    except FileNotFoundError:
+        pass
+    _rebuild()
+
+
+def _entry(name: str) -> dict:
+    live = _live.get(name, {})
+    postcode = live.get("postcode")
+    return {
+        "name": name,
+        "departement": departement(postcode),
+        "region": region(postcode),
+        "count": live.get("count", 0),
+    }
+
+
+def _rebuild() -> None:
+    """Recompute the name index and the serialized /cities payload. Caller holds _lock."""
+    global _payload, _etag
+    names = sorted(_static | set(_live), key=str.upper)
+    _by_norm.clear()
+    for name in names:
+        _by_norm.setdefault(normalize(name), name)
+
+    groups: dict[str, list[str]] = {}
+    counts: dict[str, int] = {}
+    for name in names:
+        e = _entry(name)
+        groups.setdefault(e["region"] or "Autres", []).append(name)
+        if e["count"]:
+            counts[name] = e["count"]
+
+    body = {"cities": names, "regions": groups, "counts": counts}
+    if not _live:
+        body["refreshing"] = True
+    _payload = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _etag = hashlib.sha1(_payload).hexdigest()
+
+
+def has_live() -> bool:
+    with _lock:
+        return bool(_live)
+
+
+def update_live(stats: dict[str, dict]) -> None:
+    """Replace the live city stats ({city: {"postcode", "count"}}) and rebuild the index."""
+    with _lock:
+        _load_static()
+        _live.clear()
+        _live.update(stats)
+        _rebuild()
+
+
+def payload() -> tuple[bytes, str]:
+    """Return the precomputed /cities JSON body and its ETag."""
+    with _lock:
+        _load_static()
+        return _payload, _etag
+
+
+def search(query: str, limit: int = 10) -> list[dict]:
+    """Prefix/fuzzy search by city name, or by postal-code / département prefix."""
+    q = normalize(query)
+    if not q:
+        return []
+    with _lock:
+        _load_static()
+        if q.isdigit() or q in ("2A", "2B"):
+            hits = [
+                name for name, live in _live.items()
+                if (live.get("postcode") or "").startswith(q)
+                or departement(live.get("postcode")) == q
+            ]
+            hits.sort(key=lambda n: (-_live[n].get("count", 0), n))
+            return [_entry(n) for n in hits[:limit]]
+
+        scored: dict[str, int] = {}
+        for norm, name in _by_norm.items():
+            if norm == q:
+                rank = 0
+            elif norm.startswith(q):
+                rank = 1
+            elif any(word.startswith(q) for word in norm.split()):
+                rank = 2
+            elif q in norm:
+                rank = 3
+            else:
+                continue
+            scored[name] = rank
+        if len(scored) < limit:
+            for norm in difflib.get_close_matches(q, list(_by_norm), n=limit, cutoff=0.75):
+                scored.setdefault(_by_norm[norm], 4)
+
+        ranked = sorted(
+            scored,
+            key=lambda n: (scored[n], -_live.get(n, {}).get("count", 0), n.upper()),
+        )
+        return [_entry(n) for n in ranked[:limit]]
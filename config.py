@@ -3,8 +3,10 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-TELEGRAM_BOT_TOKEN: str = os.environ["TELEGRAM_BOT_TOKEN"]
-TELEGRAM_CHAT_ID: str = os.environ["TELEGRAM_CHAT_ID"]
+# Required to send alerts; checked when sending (not at import) so the web UI
+# can boot and be used to fill them in
+TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_CHAT_ID: str = os.getenv("TELEGRAM_CHAT_ID", "")
 
 LOCATIONS: list[str] = [
     loc.strip().upper()
@@ -19,15 +21,45 @@ MAX_PRICE: int | None = int(_max_price) if _max_price else None
 
 USE_AUTH: bool = os.getenv("USE_AUTH", "false").strip().lower() == "true"
 
+# Optional: CROUS/MSE credentials for automatic headless re-login when cookies expire
+CROUS_EMAIL: str = os.getenv("CROUS_EMAIL", "")
+CROUS_PASSWORD: str = os.getenv("CROUS_PASSWORD", "")
+
 COOKIES_FILE = "cookies.json"
 STATE_FILE = "state.json"
+STATE_LOG_FILE = "state.log"     # append-only deltas since the last state.json snapshot
+STORE_FILE = "crous.db"          # shared SQLite store (status, logs, command queue)
+WORKER_LOCK_FILE = "worker.lock"  # held by the single active scraper/notifier worker
 BASE_URL = "https://trouverunlogement.lescrous.fr"
 SEARCH_URL = f"{BASE_URL}/tools/42/search"
+LOGIN_URL: str = os.getenv("CROUS_LOGIN_URL", f"{BASE_URL}/mse/discovery/connect")
+
+# Archive raw result pages for offline replay (python main.py --replay)
+ARCHIVE_PAGES: bool = os.getenv("ARCHIVE_PAGES", "false").strip().lower() == "true"
+ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+
+# Processes used to parse results pages (0 = parse in the scraping thread)
+PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", "0"))
+
+# Request governor: pacing and hourly cap for requests to the CROUS site
+GOVERNOR_RATE: float = float(os.getenv("GOVERNOR_RATE", "0.8"))            # requests per second
+GOVERNOR_BURST: int = int(os.getenv("GOVERNOR_BURST", "2"))
+GOVERNOR_MAX_PER_HOUR: int = int(os.getenv("GOVERNOR_MAX_PER_HOUR", "1000"))
+
+# Thumbnail cache for the web listings grid
+THUMBS_DIR: str = os.getenv("THUMBS_DIR", "thumbs")
+THUMBS_MAX_MB: int = int(os.getenv("THUMBS_MAX_MB", "50"))
+THUMB_WIDTH: int = int(os.getenv("THUMB_WIDTH", "320"))
 
 # Heroku — set these to persist state/cookies across dyno restarts
 HEROKU_API_KEY: str = os.getenv("HEROKU_API_KEY", "")
 HEROKU_APP_NAME: str = os.getenv("HEROKU_APP_NAME", "")
 
+# Telegram status bot: set to the app's public URL (e.g. https://my-app.herokuapp.com)
+# to receive commands via webhook instead of long polling
+TELEGRAM_WEBHOOK_URL: str = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_SECRET: str = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+
 # Web UI password (required when deployed; optional locally)
 WEB_PASSWORD: str = os.getenv("WEB_PASSWORD", "")
 
@@ -0,0 +1,176 @@
+"""
+Request governor shared by every HTTP path to the CROUS site.
+
+Each host gets a token bucket (GOVERNOR_RATE requests per second, bursts of
+up to GOVERNOR_BURST) and a rolling one-hour cap (GOVERNOR_MAX_PER_HOUR).
+Alert scans may use the whole cap. The city refresh and enrichment each get
+a 20% slice, counted against their own requests only, so they can never
+crowd out alert scans and one cannot starve the other.
+
+The bucket, the request log and the wait-time counters live in the shared
+SQLite store, so the limits are global: the worker and every gunicorn
+process draw from the same budget. Within a process, queued callers are
+served by priority: alert scans, then the city refresh, then enrichment
+(thumbnails).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+import store
+from config import GOVERNOR_RATE, GOVERNOR_BURST, GOVERNOR_MAX_PER_HOUR
+
+ALERT = 0       # alert scans and the session probe
+CITIES = 1      # full city refresh
+ENRICH = 2      # thumbnails and other nice-to-haves
+
+_NAMES = {ALERT: "alert", CITIES: "cities", ENRICH: "enrichment"}
+_BUDGET_SHARE = {CITIES: 0.2, ENRICH: 0.2}  # own slice of the hourly cap; alerts get all of it
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS governor_buckets (
+    host    TEXT PRIMARY KEY,
+    tokens  REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS governor_requests (
+    host     TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS governor_requests_host_at ON governor_requests (host, at);
+"""
+_STATS_KEY = "governor_stats"
+
+_schema_ready = threading.local()
+_cond = threading.Condition()
+_waiting: dict[str, list[tuple[int, int]]] = {}   # host → heap of (priority, ticket)
+_tickets = itertools.count()
+
+
+class BudgetExhausted(RuntimeError):
+    """The hourly cap (or this priority's slice of it) is used up."""
+
+
+def _conn():
+    conn = store.connection()
+    if not getattr(_schema_ready, "done", False):
+        conn.executescript(_SCHEMA)
+        _schema_ready.done = True
+    return conn
+
+
+def _try_take(host: str, priority: int) -> float:
+    """Take a token for host if one is available (0.0), else return the seconds to wait."""
+    name = _NAMES[priority]
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        conn.execute("DELETE FROM governor_requests WHERE host = ? AND at <= ?", (host, now - 3600))
+        if priority in _BUDGET_SHARE:
+            used = conn.execute(
+                "SELECT COUNT(*) FROM governor_requests WHERE host = ? AND priority = ?", (host, name)
+            ).fetchone()[0]
+            over_budget = used >= GOVERNOR_MAX_PER_HOUR * _BUDGET_SHARE[priority]
+        else:  # alerts: checked against everything sent to the host
+            used = conn.execute(
+                "SELECT COUNT(*) FROM governor_requests WHERE host = ?", (host,)
+            ).fetchone()[0]
+            over_budget = used >= GOVERNOR_MAX_PER_HOUR
+        if over_budget:
+            conn.execute("COMMIT")
+        else:
+            wait = _take_token(conn, host, name, now)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if over_budget:
+        _record(name, rejected=True)
+        raise BudgetExhausted(f"{name} budget for {host} used up ({used} requests in the last hour)")
+    return wait
+
+
+def _take_token(conn, host: str, name: str, now: float) -> float:
+    """Refill host's bucket and take a token (0.0) or return the wait. Commits."""
+    row = conn.execute(
+        "SELECT tokens, updated FROM governor_buckets WHERE host = ?", (host,)
+    ).fetchone()
+    tokens, updated = row if row else (float(GOVERNOR_BURST), now)
+    tokens = min(GOVERNOR_BURST, tokens + max(now - updated, 0) * GOVERNOR_RATE)
+    wait = 0.0
+    if tokens >= 1:
+        tokens -= 1
+        conn.execute(
+            "INSERT INTO governor_requests (host, priority, at) VALUES (?, ?, ?)",
+            (host, name, now),
+        )
+    else:
+        wait = (1 - tokens) / GOVERNOR_RATE
+    conn.execute(
+        "INSERT INTO governor_buckets (host, tokens, updated) VALUES (?, ?, ?) "
+        "ON CONFLICT(host) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+        (host, tokens, now),
+    )
+    conn.execute("COMMIT")
+    return wait
+
+
+def _record(name: str, waited: float = 0.0, rejected: bool = False) -> None:
+    def _apply(stats):
+        s = stats.setdefault(name, {"requests": 0, "wait_seconds": 0.0, "max_wait": 0.0, "rejected": 0})
+        if rejected:
+            s["rejected"] += 1
+        else:
+            s["requests"] += 1
+            s["wait_seconds"] = round(s["wait_seconds"] + waited, 3)
+            s["max_wait"] = round(max(s["max_wait"], waited), 3)
+        return stats
+    store.modify(_STATS_KEY, _apply, default={})
+
+
+def acquire(url: str, priority: int = ALERT) -> float:
+    """Block until a request to url's host may go out; return the time waited.
+
+    Raises BudgetExhausted instead of waiting when the hourly cap is reached.
+    """
+    host = urlsplit(url).netloc
+    ticket = (priority, next(_tickets))
+    start = time.monotonic()
+    with _cond:
+        queue = _waiting.setdefault(host, [])
+        heapq.heappush(queue, ticket)
+        try:
+            while True:
+                if queue[0] != ticket:
+                    _cond.wait()  # woken when the head of the queue leaves
+                    continue
+                wait = _try_take(host, priority)
+                if not wait:
+                    break
+                _cond.wait(wait)  # a higher-priority caller may take over the head meanwhile
+        finally:
+            queue.remove(ticket)
+            heapq.heapify(queue)
+            _cond.notify_all()
+
+    waited = time.monotonic() - start
+    _record(_NAMES[priority], waited)
+    return waited
+
+
+def snapshot() -> dict:
+    """Wait-time counters per priority and the hourly usage per host, for /metrics."""
+    rows = _conn().execute(
+        "SELECT host, priority, COUNT(*) FROM governor_requests WHERE at > ? GROUP BY host, priority",
+        (time.time() - 3600,),
+    ).fetchall()
+    hosts: dict[str, dict] = {}
+    for host, priority, count in rows:
+        h = hosts.setdefault(host, {"last_hour": 0, "max_per_hour": GOVERNOR_MAX_PER_HOUR, "by_priority": {}})
+        h["last_hour"] += count
+        h["by_priority"][priority] = count
+    return {"priorities": store.get(_STATS_KEY, {}), "hosts": hosts}
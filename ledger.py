@@ -0,0 +1,107 @@
+"""
+Durable notification ledger: one row per (listing id, chat, event type).
+
+An alert is claimed in the ledger *before* it is sent and marked sent
+afterwards, so overlapping checks never send the same alert twice. Entries
+claimed but never marked sent (crash mid-send, Telegram error) are replayed
+by replay_pending() when the worker starts and at the start of every check.
+Delivery is therefore at-least-once: a crash after Telegram accepted a
+message but before mark_sent() leads to one re-send on replay. Rows are
+never deleted; keys are mirrored in an in-memory set for fast lookups.
+
+The ledger lives in crous.db, on the local filesystem. On Heroku that disk
+is ephemeral: a dyno restart wipes it, so pending alerts are lost and
+already-sent listings are deduplicated only by the (Heroku-persisted) state.
+"""
+
+import threading
+import time
+import store
+from config import TELEGRAM_CHAT_ID
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    listing_id TEXT NOT NULL,
+    chat_id    TEXT NOT NULL,
+    event      TEXT NOT NULL,
+    message    TEXT NOT NULL,
+    image_url  TEXT,
+    claimed_at REAL NOT NULL,
+    sent_at    REAL,
+    PRIMARY KEY (listing_id, chat_id, event)
+);
+"""
+
+_lock = threading.Lock()
+_schema_ready = threading.local()
+_keys: set[tuple[str, str, str]] | None = None  # loaded on first use
+
+
+def _conn():
+    conn = store.connection()
+    if not getattr(_schema_ready, "done", False):
+        conn.executescript(_SCHEMA)
+        _schema_ready.done = True
+    return conn
+
+
+def _loaded_keys() -> set[tuple[str, str, str]]:
+    global _keys
+    if _keys is None:
+        rows = _conn().execute(
+            "SELECT listing_id, chat_id, event FROM notifications"
+        ).fetchall()
+        _keys = {tuple(r) for r in rows}
+    return _keys
+
+
+def seen(listing_id: str, event: str = "new", chat_id: str = TELEGRAM_CHAT_ID) -> bool:
+    """True if this alert was already claimed (by this or another process)."""
+    with _lock:
+        return (listing_id, str(chat_id), event) in _loaded_keys()
+
+
+def claim(listing_id: str, message: str, image_url: str | None = None,
+          event: str = "new", chat_id: str = TELEGRAM_CHAT_ID) -> bool:
+    """Atomically reserve an alert. Returns False if it was already claimed."""
+    key = (listing_id, str(chat_id), event)
+    with _lock:
+        keys = _loaded_keys()
+        if key in keys:
+            return False
+        cur = _conn().execute(
+            "INSERT OR IGNORE INTO notifications "
+            "(listing_id, chat_id, event, message, image_url, claimed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, message, image_url, time.time()),
+        )
+        keys.add(key)
+        return cur.rowcount == 1
+
+
+def mark_sent(listing_id: str, event: str = "new", chat_id: str = TELEGRAM_CHAT_ID) -> None:
+    _conn().execute(
+        "UPDATE notifications SET sent_at = ? "
+        "WHERE listing_id = ? AND chat_id = ? AND event = ?",
+        (time.time(), listing_id, str(chat_id), event),
+    )
+
+
+def replay_pending(send, log=print) -> int:
+    """Send every claimed-but-unsent alert. Returns the number delivered."""
+    rows = _conn().execute(
+        "SELECT listing_id, chat_id, event, message, image_url FROM notifications "
+        "WHERE sent_at IS NULL ORDER BY claimed_at"
+    ).fetchall()
+    delivered = 0
+    for listing_id, chat_id, event, message, image_url in rows:
+        try:
+            send(message, image_url=image_url)
+        except Exception as e:
+            log(f"  ❌ Replay failed for {listing_id}: {e}")
+            continue
+        mark_sent(listing_id, event, chat_id)
+        delivered += 1
+    if rows:
+        log(f"↻ Replayed {delivered}/{len(rows)} pending notification(s).")
+    return delivered
@@ -8,6 +8,20 @@ Usage:
     python main.py             Start the polling loop (uses .env config).
 
     python main.py --web       Start the web control interface at http://localhost:5000
+
+    python main.py --export-state FILE
+                               Write a pretty-printed copy of state.json to FILE.
+
+    python main.py --profile-startup
+                               Report slow imports (-X importtime) and the web
+                               app's boot-to-first-response time.
+
+    python main.py --replay [DIR] [--intervals 10,30] [--depths 1,3]
+                               Backtest alert latency / miss rate over pages
+                               archived with ARCHIVE_PAGES=true.
+
+    python main.py --worker    Run only the background worker (scraper, notifier,
+                               status bot). Web processes talk to it via crous.db.
 """
 
 import os
@@ -15,8 +29,38 @@ import argparse
 import schedule
 import time
 
-from config import CHECK_INTERVAL_MINUTES, USE_AUTH
-from notifier import check_and_notify
+
+BOOT_TARGET_SECONDS = 1.5  # python start → web app imported → first response served
+
+
+def _profile_startup() -> int:
+    """Print the slowest imports of the web app and check boot time against the target."""
+    import subprocess, sys
+    env = dict(os.environ, SCRAPER_WORKER="external")  # measure the web process alone
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import web"],
+                          env=env, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            rows.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+        except (IndexError, ValueError):
+            continue  # header line
+    print("Slowest imports (cumulative / self, ms):")
+    for cumulative, own, name in sorted(rows, reverse=True)[:15]:
+        print(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}")
+
+    probe = "import web; assert web.app.test_client().get('/healthz').status_code == 200"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", probe], env=env, check=True)
+    boot = time.perf_counter() - start
+    ok = boot <= BOOT_TARGET_SECONDS
+    print(f"\n⏱ Boot to first response: {boot * 1000:.0f} ms "
+          f"(target {BOOT_TARGET_SECONDS * 1000:.0f} ms) {'✅' if ok else '❌'}")
+    return 0 if ok else 1
 
 
 def main() -> None:
@@ -31,22 +75,103 @@ def main() -> None:
         action="store_true",
         help="Launch the web control interface at http://localhost:5000",
     )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report import times and boot-to-first-response time of the web app.",
+    )
+    parser.add_argument(
+        "--replay",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Replay archived scrape cycles (default: ARCHIVE_DIR) and report alert latency.",
+    )
+    parser.add_argument(
+        "--intervals",
+        default="0",
+        help="With --replay: comma-separated check intervals in minutes (0 = every cycle).",
+    )
+    parser.add_argument(
+        "--depths",
+        default="0",
+        help="With --replay: comma-separated max pages scanned per check (0 = all).",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Run the background scraper/notifier worker (one active at a time).",
+    )
+    parser.add_argument(
+        "--export-state",
+        metavar="FILE",
+        help="Write a human-readable (indented) copy of the tracked listings to FILE.",
+    )
     args = parser.parse_args()
 
+    if args.profile_startup:
+        raise SystemExit(_profile_startup())
+
+    if args.replay is not None:
+        from config import ARCHIVE_DIR
+        from replay import replay
+        replay(
+            args.replay or ARCHIVE_DIR,
+            intervals=[int(v) for v in args.intervals.split(",")],
+            depths=[int(v) for v in args.depths.split(",")],
+        )
+        return
+
+    if args.export_state:
+        from state import export_state
+        count = export_state(args.export_state)
+        print(f"💾 Exported {count} listing(s) to {args.export_state}")
+        return
+
     if args.login:
         from auth import login_and_save_cookies
         login_and_save_cookies()
         return
 
+    if args.worker:
+        import worker
+        if not worker.acquire_leader():
+            print("⚠️  Another worker is already running — exiting.")
+            return
+        print("⚙️  Worker started.")
+        worker.run(autostart=bool(os.getenv("DYNO")))
+        return
+
     if args.web:
         from config import PORT
         if os.getenv("DYNO"):
-            # On Heroku: gunicorn handles HTTP; background thread auto-starts inside web.py
+            # On Heroku: one dedicated worker process + N stateless gunicorn workers
             import subprocess, sys
-            print(f"🌐 Starting gunicorn on port {PORT}")
-            subprocess.run([sys.executable, "-m", "gunicorn", "web:app",
-                            "--bind", f"0.0.0.0:{PORT}",
-                            "--workers", "1", "--threads", "4", "--timeout", "120"])
+            env = dict(os.environ, SCRAPER_WORKER="external")
+
+            def _spawn_worker():
+                return subprocess.Popen([sys.executable, "main.py", "--worker"], env=env)
+
+            worker_proc = _spawn_worker()
+            web_workers = os.getenv("WEB_CONCURRENCY", "2")
+            print(f"🌐 Starting gunicorn on port {PORT} ({web_workers} workers)")
+            web_proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "web:app",
+                                         "--bind", f"0.0.0.0:{PORT}",
+                                         "--workers", web_workers, "--threads", "4",
+                                         "--timeout", "120"],
+                                        env=env)
+            try:
+                # Supervise the worker: gunicorn alone would keep the dyno "up" with no scraper
+                while web_proc.poll() is None:
+                    if worker_proc.poll() is not None:
+                        print(f"⚠️  Worker exited (code {worker_proc.returncode}) — restarting it.")
+                        time.sleep(5)
+                        worker_proc = _spawn_worker()
+                    time.sleep(5)
+            finally:
+                worker_proc.terminate()
+                web_proc.terminate()
+            sys.exit(web_proc.returncode)
         else:
             from web import app
             print(f"🌐 Web interface running at http://localhost:{PORT}")
@@ -54,18 +179,31 @@ def main() -> None:
             app.run(host="127.0.0.1", port=PORT, debug=False)
         return
 
-    mode = "logged-in" if USE_AUTH else "anonymous"
-    print(f"🚀 CROUS Notifier started (mode: {mode}, interval: {CHECK_INTERVAL_MINUTES} min)")
+    import worker
+    if not worker.acquire_leader():
+        print("⚠️  Another worker is already running — exiting.")
+        return
+
+    import runtime_config
+    settings = runtime_config.current()
+    mode = "logged-in" if settings.use_auth else "anonymous"
+    print(f"🚀 CROUS Notifier started (mode: {mode}, interval: {settings.check_interval_minutes} min)")
     print("Press Ctrl+C to stop.\n")
 
-    # Run once immediately, then on schedule
+    # Run once immediately (each check first re-sends alerts left pending)
+    from notifier import check_and_notify
     check_and_notify()
-    schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(check_and_notify)
+    interval = settings.check_interval_minutes
+    schedule.every(interval).minutes.do(check_and_notify)
 
     while True:
         schedule.run_pending()
         time.sleep(30)
-
+        # Pick up interval changes made from the web UI or the bot
+        if runtime_config.current().check_interval_minutes != interval:
+            interval = runtime_config.current().check_interval_minutes
+            schedule.clear()
+            schedule.every(interval).minutes.do(check_and_notify)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,52 @@
+"""
+Accommodation record used end to end (scraper → filters → notifier → state → web).
+
+A slotted dataclass instead of a dict: no per-instance __dict__, residence
+names/addresses/price labels interned so listings of the same residence share
+one string, and the lowest rent kept as a float for filtering. to_dict()
+omits empty fields, which keeps placeholder entries ({"id": ...}) tiny.
+"""
+
+import sys
+from dataclasses import dataclass, fields
+
+
+def _intern(value: str | None) -> str | None:
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True)
+class Accommodation:
+    id: str
+    name: str = ""
+    address: str = ""
+    price: str = ""                 # label as shown on the site, e.g. "De 250 € à 400 €"
+    price_min: float | None = None  # lowest rent parsed from the label
+    url: str = ""
+    image_url: str | None = None
+    first_seen: str | None = None   # ISO timestamp, set by state.save_state
+
+    def __post_init__(self) -> None:
+        self.name = _intern(self.name)
+        self.address = _intern(self.address)
+        self.price = _intern(self.price)
+
+    def to_dict(self) -> dict:
+        return {
+            f: v for f in _FIELDS
+            if (v := getattr(self, f)) is not None and v != ""
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Accommodation":
+        return cls(**{f: data[f] for f in _FIELDS if f in data})
+
+    def to_tuple(self) -> tuple:
+        return tuple(getattr(self, f) for f in _FIELDS)
+
+    @classmethod
+    def from_tuple(cls, values: tuple) -> "Accommodation":
+        return cls(*values)
+
+
+_FIELDS = tuple(f.name for f in fields(Accommodation))
@@ -1,45 +1,88 @@
 """
 Core logic: fetch current listings, compare with stored state,
 send Telegram alerts for any new accommodations, then update state.
+Every alert goes through the notification ledger (ledger.py) so it is
+sent at most once, even across restarts and overlapping checks.
 """
 
-from scraper import fetch_all_accommodations
-from state import load_state, save_state, load_listings
+import ledger
+import scraper
+from models import Accommodation
+from state import load_state, save_state
 from telegram_bot import send_message
 
 
-def _format_message(acc: dict) -> str:
+def _format_message(acc: Accommodation) -> str:
     return (
         f"🏠 <b>Nouveau logement CROUS disponible !</b>\n\n"
-        f"📍 <b>{acc['name']}</b>\n"
-        f"{acc['address']}\n"
-        f"💶 {acc['price']}\n"
-        f"🔗 <a href=\"{acc['url']}\">Voir le logement</a>"
+        f"📍 <b>{acc.name}</b>\n"
+        f"{acc.address}\n"
+        f"💶 {acc.price}\n"
+        f"🔗 <a href=\"{acc.url}\">Voir le logement</a>"
     )
 
 
-def check_and_notify() -> None:
-    print("🔍 Checking for new accommodations...")
+def notify_new(accommodations: list[Accommodation], log=print) -> int:
+    """Claim and send one alert per accommodation. Returns the number sent."""
+    sent = 0
+    for acc in accommodations:
+        message = _format_message(acc)
+        if not ledger.claim(acc.id, message, acc.image_url):
+            continue  # already notified (earlier run or concurrent check)
+        try:
+            send_message(message, image_url=acc.image_url)
+        except Exception as e:
+            log(f"  ❌ Telegram send failed for {acc.name}: {e}")
+            continue
+        ledger.mark_sent(acc.id)
+        log(f"  ✅ Notified: {acc.name} — {acc.address}")
+        sent += 1
+    return sent
 
+
+def check_and_notify(log=print, sweep=None) -> dict | None:
+    """Run one sweep, alerting page by page as results arrive.
+
+    sweep is the page generator to consume (default: a live
+    scraper.iter_accommodation_pages(); replay.py passes archived pages).
+    Returns a summary (current_ids, known_ids, sent) or None if the scrape failed.
+    """
+    log("🔍 Checking for new accommodations...")
+
+    # Alerts whose send failed in an earlier cycle are claimed (ledger.seen filters
+    # them out below), so retry them here rather than waiting for a restart
     try:
-        current = fetch_all_accommodations()
+        ledger.replay_pending(send_message, log=log)
     except Exception as e:
-        print(f"❌ Scrape failed: {e}")
-        return
+        log(f"⚠️ Notification replay failed: {e}")
 
     known_ids = load_state()
-    current_ids = {a["id"] for a in current}
-
-    new_accommodations = [a for a in current if a["id"] not in known_ids]
-
-    if new_accommodations:
-        print(f"🆕 {len(new_accommodations)} new accommodation(s) found! Sending notifications...")
-        for acc in new_accommodations:
-            try:
-                send_message(_format_message(acc), image_url=acc.get("image_url"))
-                print(f"  ✅ Notified: {acc['name']} — {acc['address']}")
-            except Exception as e:
-                print(f"  ❌ Telegram send failed for {acc['name']}: {e}")
-        save_state(known_ids | current_ids, current)
-    else:
-        print(f"✓ No new accommodations. ({len(current_ids)} listings tracked)")
+    current: list[Accommodation] = []
+    found = sent = 0
+
+    try:
+        if sweep is None:
+            sweep = scraper.iter_accommodation_pages()
+        for batch in sweep:
+            current.extend(batch)
+            new_in_batch = [
+                a for a in batch if a.id not in known_ids and not ledger.seen(a.id)
+            ]
+            if new_in_batch:
+                found += len(new_in_batch)
+                log(f"🆕 {len(new_in_batch)} new accommodation(s) found! Sending notifications...")
+                sent += notify_new(new_in_batch, log=log)
+    except Exception as e:
+        log(f"❌ Scrape failed: {e}")
+        return None
+
+    sweep = scraper.last_sweep
+    if not sweep["complete"]:
+        # Pages that failed are simply missing: their listings stay tracked as before
+        log(f"⚠️ Partial sweep: {len(sweep['failed_pages'])}/{sweep['total_pages']} page(s) failed.")
+
+    current_ids = {a.id for a in current}
+    save_state(known_ids | current_ids, current)  # appends only what changed
+    if not found:
+        log(f"✓ No new accommodations. ({len(current_ids)} listings tracked)")
+    return {"current_ids": current_ids, "known_ids": known_ids, "sent": sent}
@@ -0,0 +1,166 @@
+"""
+Offline backtest over archived scrape cycles (python main.py --replay).
+
+Every scheduling setting (check interval × how many pages each check scans)
+is replayed through the live code path: archived pages are fed to
+scraper.iter_accommodation_pages() and consumed by
+notifier.check_and_notify(). Diffing, the alert ledger and partial-sweep
+handling therefore behave exactly as in production. send_message is swapped
+for an in-memory sink. Each setting runs in its own process inside a
+temporary directory, so it gets a fresh state, ledger and store and never
+touches the real ones.
+
+The first archived cycle is a warm-up that builds the tracked state, as a
+first live run would. Ground truth is the full archive: a listing "appears"
+on the first archived page it shows up on. Latencies can't be finer than
+the archive's own cadence.
+"""
+
+import os
+import statistics
+import tempfile
+
+
+def _load_manifests(archive_dir: str) -> list[dict]:
+    import archive
+    return list(archive.iter_cycles(archive_dir))
+
+
+def _appearances(manifests: list[dict], archive_dir: str, settings) -> dict[str, float]:
+    """When every listing that matches the filters first appeared after the first cycle."""
+    import archive
+    from scraper import _matches, _parse_cards, _soup
+
+    parsed: dict[str, set[str]] = {}  # sha → matching ids; identical pages parse once
+
+    def _ids(sha: str) -> set[str]:
+        if sha not in parsed:
+            soup = _soup(archive.load_page(sha, archive_dir))
+            parsed[sha] = {a.id for a in _parse_cards(soup) if _matches(a, settings)}
+        return parsed[sha]
+
+    baseline = set().union(*(_ids(p["sha"]) for p in manifests[0]["pages"]))
+    appeared: dict[str, float] = {}
+    for manifest in manifests[1:]:
+        for entry in sorted(manifest["pages"], key=lambda p: p["page"]):
+            for acc_id in _ids(entry["sha"]) - baseline:
+                appeared.setdefault(acc_id, entry["fetched_at"])
+    return appeared
+
+
+def _run_schedule(archive_dir: str, manifests: list[dict], settings: dict,
+                  interval_minutes: int, max_pages: int) -> dict[str, float]:
+    """Replay one schedule in this (fresh) process. Returns {listing id: alert time}."""
+    home = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="crous-replay-") as tmp:
+        os.chdir(tmp)  # state.json, state.log and crous.db are relative paths
+        # Read by config at import: no Heroku sync, inline parsing so alert times line up
+        os.environ.update(HEROKU_API_KEY="", PARSE_WORKERS="0")
+        try:
+            import requests
+            import archive
+            import notifier
+            import runtime_config
+            import scraper
+            import store
+
+            runtime_config.update(**settings)
+            clock = [0.0]                       # fetched_at of the page being processed
+            sent: list[tuple[str, float]] = []  # (message, alert time)
+            notifier.send_message = lambda message, image_url=None: sent.append((message, clock[0]))
+
+            def _fetcher(manifest: dict):
+                entries = {p["page"]: p for p in manifest["pages"]}
+
+                def fetch(page: int) -> bytes:
+                    entry = entries.get(page)
+                    if entry is None:  # failed during the live sweep
+                        raise requests.RequestException(f"page {page} not archived")
+                    clock[0] = entry["fetched_at"]
+                    return archive.load_page(entry["sha"], archive_dir)
+                return fetch
+
+            def _quiet(msg: str) -> None:
+                pass
+
+            notifier.check_and_notify(
+                log=_quiet, sweep=scraper.iter_accommodation_pages(fetch=_fetcher(manifests[0]))
+            )
+            sent.clear()  # warm-up alerts are the initial backlog, not new listings
+
+            next_run = manifests[0]["started"] + interval_minutes * 60
+            for manifest in manifests[1:]:
+                if manifest["started"] < next_run:
+                    continue
+                next_run = manifest["started"] + interval_minutes * 60
+                notifier.check_and_notify(log=_quiet, sweep=scraper.iter_accommodation_pages(
+                    fetch=_fetcher(manifest), max_pages=max_pages,
+                ))
+
+            conn = store.connection()
+            by_message = dict(conn.execute("SELECT message, listing_id FROM notifications"))
+            conn.close()
+        finally:
+            os.chdir(home)
+
+    alerted: dict[str, float] = {}
+    for message, at in sent:
+        alerted.setdefault(by_message[message], at)
+    return alerted
+
+
+def replay(archive_dir: str, intervals: list[int] = (0,), depths: list[int] = (0,)) -> list[dict]:
+    """Backtest every (interval, depth) pair; 0 means every archived cycle / all pages."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import runtime_config
+
+    archive_dir = os.path.abspath(archive_dir)
+    manifests = _load_manifests(archive_dir)
+    if len(manifests) < 2:
+        print(f"⚠️  Need at least two archived cycles in {archive_dir}/ (found {len(manifests)}).")
+        return []
+    settings = runtime_config.current()
+    appeared = _appearances(manifests, archive_dir, settings)
+    print(f"📼 {len(manifests)} cycles, {len(appeared)} listing(s) appeared after the first one.\n")
+
+    snapshot = {
+        "locations": list(settings.locations),
+        "max_price": settings.max_price,
+        "use_auth": settings.use_auth,
+    }
+    grid = [(interval, depth) for interval in intervals for depth in depths]
+    # One fresh process per schedule: module-level state/ledger caches never leak between runs
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"),
+                             max_tasks_per_child=1) as pool:
+        futures = [
+            pool.submit(_run_schedule, archive_dir, manifests, snapshot, interval, depth)
+            for interval, depth in grid
+        ]
+        results = [f.result() for f in futures]
+
+    rows = []
+    for (interval, depth), alerted in zip(grid, results):
+        latencies = sorted(alerted[i] - appeared[i] for i in appeared if i in alerted)
+        missed = len(appeared) - len(latencies)
+        rows.append({
+            "interval": interval,
+            "depth": depth,
+            "alerts": len(alerted),
+            "missed": missed,
+            "miss_rate": missed / len(appeared) if appeared else 0.0,
+            "median_latency": statistics.median(latencies) if latencies else None,
+            "p90_latency": latencies[int(0.9 * (len(latencies) - 1))] if latencies else None,
+        })
+
+    def _fmt(seconds: float | None) -> str:
+        return "—" if seconds is None else f"{seconds / 60:.1f} min"
+
+    print(f"{'interval':>9} {'pages':>6} {'alerts':>7} {'missed':>7} {'miss %':>7} {'median':>11} {'p90':>11}")
+    for r in rows:
+        print(
+            f"{(str(r['interval']) + ' min') if r['interval'] else 'every':>9} "
+            f"{r['depth'] or 'all':>6} {r['alerts']:>7} {r['missed']:>7} "
+            f"{r['miss_rate'] * 100:>6.1f}% {_fmt(r['median_latency']):>11} {_fmt(r['p90_latency']):>11}"
+        )
+    return rows
@@ -0,0 +1,87 @@
+"""
+Settings that can change while the notifier runs: locations, check
+interval, max price and auth mode.
+
+Defaults come from the environment (config.py). Changes from the settings
+form or the Telegram /subscribe command are saved in the shared store with
+an incremented version. The scraper, filters and scheduler call current()
+to get an immutable snapshot, so an update takes effect on the next cycle
+without a restart, a module reload or losing in-memory caches.
+"""
+
+import threading
+from dataclasses import dataclass
+
+import config
+import store
+
+_KEY = "runtime_config"
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    version: int
+    locations: tuple[str, ...]
+    check_interval_minutes: int
+    max_price: int | None
+    use_auth: bool
+
+
+_lock = threading.Lock()
+_cached: Settings | None = None
+
+
+def _defaults() -> dict:
+    return {
+        "version": 0,
+        "locations": list(config.LOCATIONS),
+        "check_interval_minutes": config.CHECK_INTERVAL_MINUTES,
+        "max_price": config.MAX_PRICE,
+        "use_auth": config.USE_AUTH,
+    }
+
+
+def _normalize(values: dict) -> dict:
+    locations = values["locations"]
+    if isinstance(locations, str):
+        locations = locations.split(",")
+    max_price = values["max_price"]
+    if isinstance(max_price, str):
+        max_price = int(max_price) if max_price.strip() else None
+    use_auth = values["use_auth"]
+    if isinstance(use_auth, str):
+        use_auth = use_auth.strip().lower() == "true"
+    return {
+        "version": int(values["version"]),
+        "locations": list(dict.fromkeys(
+            loc.strip().upper() for loc in locations if loc.strip()
+        )),
+        "check_interval_minutes": max(1, int(values["check_interval_minutes"])),
+        "max_price": max_price,
+        "use_auth": bool(use_auth),
+    }
+
+
+def _to_settings(values: dict) -> Settings:
+    return Settings(**{**values, "locations": tuple(values["locations"])})
+
+
+def current() -> Settings:
+    """Latest settings snapshot (one small store read; same object while unchanged)."""
+    global _cached
+    stored = store.get(_KEY)
+    values = _normalize({**_defaults(), **stored}) if stored else _defaults()
+    with _lock:
+        if _cached is None or _cached.version != values["version"]:
+            _cached = _to_settings(values)
+        return _cached
+
+
+def update(**changes) -> Settings:
+    """Atomically apply changes (any Settings field but version) and bump the version."""
+    def _apply(stored):
+        merged = {**_defaults(), **(stored or {}), **changes}
+        merged["version"] = (stored or {}).get("version", 0) + 1
+        return _normalize(merged)
+
+    return _to_settings(store.modify(_KEY, _apply))
@@ -1,25 +1,49 @@
 """
 Scrapes /tools/42/search, iterates all pages, and returns a list of
-Accommodation dicts filtered by the configured LOCATIONS.
+Accommodation records filtered by the configured locations and max price
+(read from runtime_config once per sweep).
 """
 
-import json
+from __future__ import annotations
+
 import re
 import time
 import random
+import threading
+from collections import deque
 import requests
-from bs4 import BeautifulSoup
-from config import (
-    BASE_URL, SEARCH_URL, COOKIES_FILE, LOCATIONS, MAX_PRICE, USE_AUTH
-)
+from typing import TYPE_CHECKING
+import governor
+import runtime_config
+from config import BASE_URL, SEARCH_URL, COOKIES_FILE, ARCHIVE_PAGES, PARSE_WORKERS
+from models import Accommodation
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# ── Resilience ──────────────────────────────────────────────────────────────
+MAX_RETRIES = 3              # per page, on network errors / 429 / 5xx
+BACKOFF_BASE = 2.0           # seconds; doubles each attempt, plus jitter
+BREAKER_THRESHOLD = 5        # consecutive failed requests before pausing scraping
+BREAKER_COOLDOWN = 15 * 60   # seconds the breaker stays open
+MAX_RETRY_AFTER = 60         # longer Retry-After values open the breaker instead of sleeping
+
+fetch_stats = {
+    "requests": 0,
+    "retries": 0,
+    "failed_pages": 0,
+    "partial_sweeps": 0,
+    "breaker_trips": 0,
+}
+last_sweep = {"total_pages": 0, "failed_pages": [], "complete": True}
+
+_consecutive_failures = 0
+_breaker_open_until = 0.0
 
-_auth_warning_sent = False  # send only once per process run
 
+class CircuitOpenError(RuntimeError):
+    """The CROUS site keeps failing (429/5xx); scraping is paused until the cooldown ends."""
 
-def _is_logged_in(soup: BeautifulSoup) -> bool:
-    """Return False if the page still shows the login button (cookies expired/invalid)."""
-    login_link = soup.select_one('a[href="/mse/discovery/connect"]')
-    return login_link is None
 
 HEADERS = {
     "User-Agent": (
@@ -31,25 +55,86 @@ HEADERS = {
 }
 
 
-def _build_session() -> requests.Session:
+def _build_session(use_auth: bool = False) -> requests.Session:
     session = requests.Session()
     session.headers.update(HEADERS)
 
-    if USE_AUTH:
-        from auth import ensure_cookies_file
-        ensure_cookies_file()
-        try:
-            with open(COOKIES_FILE, encoding="utf-8") as f:
-                cookies = json.load(f)
-            for c in cookies:
-                session.cookies.set(c["name"], c["value"], domain=c.get("domain"))
+    if use_auth:
+        import session_manager
+        if session_manager.apply_cookies(session):
             print("🔐 Using saved login cookies.")
-        except FileNotFoundError:
+        else:
             print(f"⚠️  {COOKIES_FILE} not found — falling back to anonymous mode.")
 
     return session
 
 
+def _check_breaker() -> None:
+    remaining = _breaker_open_until - time.time()
+    if remaining > 0:
+        raise CircuitOpenError(f"circuit open — site failing, retrying in {int(remaining)}s")
+
+
+def _record_result(ok: bool) -> None:
+    global _consecutive_failures
+    if ok:
+        _consecutive_failures = 0
+        return
+    _consecutive_failures += 1
+    if _consecutive_failures >= BREAKER_THRESHOLD:
+        _open_breaker(BREAKER_COOLDOWN)
+
+
+def _open_breaker(seconds: float) -> None:
+    global _consecutive_failures, _breaker_open_until
+    _consecutive_failures = 0
+    _breaker_open_until = time.time() + seconds
+    fetch_stats["breaker_trips"] += 1
+    print(f"⛔ Circuit breaker open — pausing scraping for {int(seconds) // 60} min.")
+
+
+def _get_page(session: requests.Session, page: int,
+              priority: int = governor.ALERT) -> requests.Response:
+    """GET one results page, retrying network errors, 429 and 5xx with backoff + jitter.
+
+    Every attempt goes through the request governor (pacing + hourly cap).
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        _check_breaker()
+        governor.acquire(SEARCH_URL, priority)
+        fetch_stats["requests"] += 1
+        try:
+            resp = session.get(SEARCH_URL, params={"page": page}, timeout=30)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error, retry_after = e, None
+        else:
+            if resp.status_code != 429 and resp.status_code < 500:
+                resp.raise_for_status()  # other 4xx: not worth retrying
+                _record_result(True)
+                return resp
+            error = requests.HTTPError(f"{resp.status_code} on page {page}", response=resp)
+            retry_after = resp.headers.get("Retry-After")
+        _record_result(False)
+        if attempt == MAX_RETRIES:
+            raise error
+        _check_breaker()
+        delay = BACKOFF_BASE * 2 ** attempt + random.uniform(0, BACKOFF_BASE)
+        if retry_after and retry_after.isdigit():
+            wait = int(retry_after)
+            if wait > MAX_RETRY_AFTER:
+                # Don't sleep inside the check lock for that long: pause scraping instead
+                _open_breaker(min(wait, BREAKER_COOLDOWN))
+                raise CircuitOpenError(f"site asked to retry in {wait}s (page {page})")
+            delay = max(delay, wait)
+        fetch_stats["retries"] += 1
+        time.sleep(delay)
+
+
+def _soup(content: bytes) -> BeautifulSoup:
+    from bs4 import BeautifulSoup  # deferred: keeps web/worker boot fast
+    return BeautifulSoup(content, "html.parser", from_encoding="utf-8")
+
+
 def _get_total_pages(soup: BeautifulSoup) -> int:
     """Extract total page count from the <title> tag."""
     title = soup.find("title")
@@ -67,7 +152,7 @@ def _parse_price(text: str) -> float | None:
     return min(values) if values else None
 
 
-def _parse_cards(soup: BeautifulSoup) -> list[dict]:
+def _parse_cards(soup: BeautifulSoup) -> list[Accommodation]:
     accommodations = []
     for card in soup.select("li.fr-col-lg-4"):
         title_tag = card.select_one("h3.fr-card__title a")
@@ -90,68 +175,190 @@ def _parse_cards(soup: BeautifulSoup) -> list[dict]:
         if image_url and image_url.startswith("/"):
             image_url = f"{BASE_URL}{image_url}"
 
-        accommodations.append({
-            "id": acc_id,
-            "name": name,
-            "address": address,
-            "price": price_str,
-            "price_min": _parse_price(price_str),
-            "url": url,
-            "image_url": image_url,
-        })
+        accommodations.append(Accommodation(
+            id=acc_id,
+            name=name,
+            address=address,
+            price=price_str,
+            price_min=_parse_price(price_str),
+            url=url,
+            image_url=image_url,
+        ))
     return accommodations
 
 
-def _matches_location(accommodation: dict) -> bool:
-    if not LOCATIONS:
+def _matches_location(accommodation: Accommodation, locations: tuple[str, ...]) -> bool:
+    if not locations:
         return True
-    addr_upper = accommodation["address"].upper()
-    return any(loc in addr_upper for loc in LOCATIONS)
+    addr_upper = accommodation.address.upper()
+    return any(loc in addr_upper for loc in locations)
 
 
-def _matches_price(accommodation: dict) -> bool:
-    if MAX_PRICE is None:
+def _matches_price(accommodation: Accommodation, max_price: int | None) -> bool:
+    if max_price is None:
         return True
-    price_min = accommodation.get("price_min")
+    price_min = accommodation.price_min
     if price_min is None:
         return True
-    return price_min <= MAX_PRICE
-
-
-def fetch_all_accommodations() -> list[dict]:
-    global _auth_warning_sent
-    session = _build_session()
-    all_results: list[dict] = []
-
-    # Fetch page 1 first to determine total pages
-    resp = session.get(SEARCH_URL, params={"page": 1}, timeout=30)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.content, "html.parser", from_encoding="utf-8")
-
-    # Detect expired/invalid cookies
-    if USE_AUTH and not _is_logged_in(soup):
-        if not _auth_warning_sent:
-            from telegram_bot import send_message
-            send_message(
-                "⚠️ <b>CROUS Notifier</b>: Login cookies have expired or are invalid.\n"
-                "Falling back to <b>anonymous mode</b> (fewer listings visible).\n\n"
-                "Run <code>python main.py --login</code> to re-authenticate."
-            )
-            _auth_warning_sent = True
-        print("⚠️  Cookies invalid — running in anonymous mode.")
-
-    total_pages = _get_total_pages(soup)
-    all_results.extend(_parse_cards(soup))
+    return price_min <= max_price
 
-    for page in range(2, total_pages + 1):
-        time.sleep(random.uniform(0.5, 2.0))  # polite delay
-        resp = session.get(SEARCH_URL, params={"page": page}, timeout=30)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.content, "html.parser", from_encoding="utf-8")
-        all_results.extend(_parse_cards(soup))
 
-    filtered = [a for a in all_results if _matches_location(a) and _matches_price(a)]
-    return filtered
+def _matches(accommodation: Accommodation, settings) -> bool:
+    return (_matches_location(accommodation, settings.locations)
+            and _matches_price(accommodation, settings.max_price))
+
+
+# ── Parse pool ──────────────────────────────────────────────────────────────
+# With PARSE_WORKERS > 0, pages are parsed in separate processes from their raw
+# bytes, so parsing runs in parallel with the next fetch and does not hold the
+# GIL that the web threads of this process need.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parse_page(content: bytes) -> tuple[int, list[tuple]]:
+    """Raw results page → (total pages, listing tuples). Runs in the parse pool."""
+    soup = _soup(content)
+    return _get_total_pages(soup), [a.to_tuple() for a in _parse_cards(soup)]
+
+
+def _parse_city_page(content: bytes) -> tuple[int, dict[str, dict]]:
+    """Raw results page → (total pages, city stats of that page). Runs in the parse pool."""
+    soup = _soup(content)
+    stats: dict[str, dict] = {}
+    _collect_city_stats(soup, stats)
+    return _get_total_pages(soup), stats
+
+
+def _parse_pool():
+    """Return the shared parse pool (created on first use), or None if disabled."""
+    global _pool
+    if PARSE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Never fork: this process has web/scheduler threads holding locks
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=ctx)
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _parse_async(fn, content: bytes):
+    """Start fn(content) in the parse pool (inline without one); call the result to get it.
+
+    If the pool dies (a worker crashed), it is shut down and recreated on the
+    next page, and the affected page is parsed inline instead.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+    pool = _parse_pool()
+    future = None
+    if pool is not None:
+        try:
+            future = pool.submit(fn, content)
+        except BrokenProcessPool:
+            print("⚠️  Parse pool crashed — parsing inline and restarting it.")
+            _reset_pool()
+    if future is None:
+        value = fn(content)
+        return lambda: value
+
+    def result():
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            print("⚠️  Parse pool crashed — parsing inline and restarting it.")
+            _reset_pool()
+            return fn(content)
+    return result
+
+
+def iter_accommodation_pages(fetch=None, max_pages: int = 0):
+    """Yield the filtered accommodations of each results page as soon as it is parsed.
+
+    Pages that still fail after retries are skipped (partial sweep); see last_sweep.
+    With ARCHIVE_PAGES=true the raw pages are also saved for offline replay.
+
+    fetch(page) -> bytes replaces the HTTP session (replay.py feeds archived
+    pages this way; they are not archived again). max_pages > 0 stops the
+    sweep after that many pages.
+    """
+    settings = runtime_config.current()  # one snapshot for the whole sweep
+    manifest = None
+    if fetch is None:
+        session = _build_session(settings.use_auth)
+
+        def fetch(page: int) -> bytes:
+            return _get_page(session, page).content
+
+        if ARCHIVE_PAGES:
+            import archive
+            manifest = archive.new_manifest()
+        # Cheap validity probe before the sweep (refreshes expired cookies in the background)
+        if settings.use_auth:
+            import session_manager
+            session_manager.ensure_valid(session)
+
+    pending: deque = deque()  # page parses in flight (result callables), in page order
+
+    def _submit(page: int, content: bytes):
+        if manifest is not None:
+            archive.record_page(manifest, page, content)
+        return _parse_async(_parse_page, content)
+
+    def _filtered(listings: list[tuple]) -> list[Accommodation]:
+        return [a for a in map(Accommodation.from_tuple, listings) if _matches(a, settings)]
+
+    def _drain(keep: int):
+        # Up to PARSE_WORKERS pages keep parsing while the next one is fetched
+        while len(pending) > keep:
+            yield _filtered(pending.popleft()()[1])
+
+    try:
+        # Fetch page 1 first to determine total pages (without it there is nothing to sweep)
+        content = fetch(1)
+        total_pages, listings = _submit(1, content)()
+        last_sweep.update(total_pages=total_pages, failed_pages=[], complete=True)
+        yield _filtered(listings)
+
+        last_page = min(total_pages, max_pages) if max_pages > 0 else total_pages
+        for page in range(2, last_page + 1):
+            try:
+                content = fetch(page)  # paced by the governor
+            except (CircuitOpenError, governor.BudgetExhausted) as e:
+                print(f"⛔ Stopping sweep at page {page}: {e}")
+                last_sweep["failed_pages"].extend(range(page, total_pages + 1))
+                break
+            except requests.RequestException as e:
+                print(f"⚠️  Page {page} failed after retries: {e}")
+                fetch_stats["failed_pages"] += 1
+                last_sweep["failed_pages"].append(page)
+                continue
+            pending.append(_submit(page, content))
+            yield from _drain(keep=max(PARSE_WORKERS, 0))
+        yield from _drain(keep=0)
+    finally:
+        if manifest is not None:
+            archive.save_manifest(manifest)
+
+    if last_sweep["failed_pages"]:
+        last_sweep["complete"] = False
+        fetch_stats["partial_sweeps"] += 1
+
+
+def fetch_all_accommodations() -> list[Accommodation]:
+    return [a for batch in iter_accommodation_pages() for a in batch]
 
 
 def _extract_city(address: str) -> str | None:
@@ -160,34 +367,51 @@ def _extract_city(address: str) -> str | None:
     return m.group(1).strip() if m else None
 
 
-def get_all_cities(polite_delay: bool = True) -> list[str]:
-    """Fetch all listing pages and return a sorted list of unique city names."""
-    session = _build_session()
-    cities: set[str] = set()
+def _extract_postcode(address: str) -> str | None:
+    """Extract the postal code from an address string like '47000 AGEN' → '47000'."""
+    m = re.search(r'(\d{5})\s+.+$', address.strip())
+    return m.group(1) if m else None
 
-    resp = session.get(SEARCH_URL, params={"page": 1}, timeout=30)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.content, "html.parser", from_encoding="utf-8")
-    total_pages = _get_total_pages(soup)
 
+def _collect_city_stats(soup: BeautifulSoup, stats: dict[str, dict]) -> None:
     for card in soup.select("li.fr-col-lg-4"):
         addr_tag = card.select_one("p.fr-card__desc")
-        if addr_tag:
-            city = _extract_city(addr_tag.get_text(strip=True))
-            if city:
-                cities.add(city)
+        if not addr_tag:
+            continue
+        address = addr_tag.get_text(strip=True)
+        city = _extract_city(address)
+        if not city:
+            continue
+        entry = stats.setdefault(city, {"postcode": _extract_postcode(address), "count": 0})
+        entry["count"] += 1
+
+
+def get_city_stats() -> dict[str, dict]:
+    """Fetch all listing pages and return {city: {"postcode", "count"}} for every city seen."""
+    session = _build_session(runtime_config.current().use_auth)
+    stats: dict[str, dict] = {}
+    pending: deque = deque()
+
+    def _merge(page_stats: dict[str, dict]) -> None:
+        for city, e in page_stats.items():
+            entry = stats.setdefault(city, {"postcode": e["postcode"], "count": 0})
+            entry["count"] += e["count"]
+
+    resp = _get_page(session, 1, governor.CITIES)
+    total_pages, page_stats = _parse_async(_parse_city_page, resp.content)()
+    _merge(page_stats)
 
     for page in range(2, total_pages + 1):
-        if polite_delay:
-            time.sleep(random.uniform(0.3, 1.0))
-        resp = session.get(SEARCH_URL, params={"page": page}, timeout=30)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.content, "html.parser", from_encoding="utf-8")
-        for card in soup.select("li.fr-col-lg-4"):
-            addr_tag = card.select_one("p.fr-card__desc")
-            if addr_tag:
-                city = _extract_city(addr_tag.get_text(strip=True))
-                if city:
-                    cities.add(city)
-
-    return sorted(cities)
+        resp = _get_page(session, page, governor.CITIES)
+        pending.append(_parse_async(_parse_city_page, resp.content))
+        while len(pending) > max(PARSE_WORKERS, 0):
+            _merge(pending.popleft()()[1])
+    for result in pending:
+        _merge(result()[1])
+
+    return stats
+
+
+def get_all_cities() -> list[str]:
+    """Fetch all listing pages and return a sorted list of unique city names."""
+    return sorted(get_city_stats())
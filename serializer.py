@@ -0,0 +1,59 @@
+"""
+JSON (de)serialization used for state files and web responses.
+
+Uses orjson when it is installed and falls back to the stdlib json module.
+Machine files are written compact; pass pretty=True for human-readable
+exports. write_atomic() writes to a temp file and renames it over the
+target, so readers never see a half-written file.
+"""
+
+import json
+import os
+import tempfile
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj):
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, pretty: bool = False) -> bytes:
+    if orjson is not None:
+        # Passthrough: dataclasses go through to_dict() like on the stdlib path
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    if pretty:
+        text = json.dumps(obj, default=_default, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Replace path with data in one step (temp file in the same dir + os.replace)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
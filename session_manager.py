@@ -0,0 +1,172 @@
+"""
+Login session health for USE_AUTH mode.
+
+Keeps the parsed cookies.json in memory (reloaded only when the file
+changes), tracks when the saved cookies expire, checks validity with a cheap
+partial request before each cycle, and — when CROUS_EMAIL/CROUS_PASSWORD are
+set — renews the cookies with headless Playwright in a background thread so
+the scrape loop never waits for a login.
+"""
+
+import json
+import os
+import threading
+import time
+import requests
+import governor
+from config import COOKIES_FILE, SEARCH_URL, CROUS_EMAIL, CROUS_PASSWORD
+
+PROBE_BYTES = 128 * 1024          # the login button sits in the page header
+_LOGIN_MARKER = b'href="/mse/discovery/connect"'
+_AUTH_COOKIE_HINTS = ("sess", "auth", "token", "login")  # lower-case name fragments
+
+_lock = threading.Lock()
+_cache: tuple[float, list[dict]] | None = None   # (cookies.json mtime, cookies)
+_last_valid: bool | None = None
+_warning_sent = False
+_refresh_thread: threading.Thread | None = None
+
+
+def load_cookies() -> list[dict] | None:
+    """Return the saved cookies, re-reading cookies.json only when it changed."""
+    global _cache
+    from auth import ensure_cookies_file
+    ensure_cookies_file()
+    try:
+        mtime = os.path.getmtime(COOKIES_FILE)
+    except OSError:
+        return None
+    with _lock:
+        if _cache is None or _cache[0] != mtime:
+            try:
+                with open(COOKIES_FILE, encoding="utf-8") as f:
+                    _cache = (mtime, json.load(f))
+            except (OSError, json.JSONDecodeError):
+                return None
+        return _cache[1]
+
+
+def _is_auth_cookie(cookie: dict) -> bool:
+    name = cookie.get("name", "").lower()
+    return any(part in name for part in _AUTH_COOKIE_HINTS)
+
+
+def expires_at(cookies: list[dict] | None = None) -> float | None:
+    """When the login itself expires (epoch seconds); None if unknown.
+
+    Playwright saves every cookie of the context, including short-lived
+    tracking/anti-bot ones (_gat, __cf_bm), so the earliest expiry says
+    nothing about the login. Use the session/auth cookies when they can be
+    recognised, otherwise the moment the last cookie expires.
+    """
+    cookies = load_cookies() if cookies is None else cookies
+    cookies = cookies or []
+    auth = [c for c in cookies if _is_auth_cookie(c)]
+    candidates = auth or cookies
+    if any((c.get("expires") or -1) <= 0 for c in candidates):
+        return None  # a browser-session cookie: no expiry to go by, let the probe decide
+    expiries = [c["expires"] for c in candidates]
+    return max(expiries) if expiries else None
+
+
+def apply_cookies(session: requests.Session) -> bool:
+    """Attach the cached cookies to a session. Returns False if none are saved."""
+    cookies = load_cookies()
+    if cookies is None:
+        return False
+    for c in cookies:
+        session.cookies.set(c["name"], c["value"], domain=c.get("domain"))
+    return True
+
+
+def probe(session: requests.Session) -> bool | None:
+    """Read just the top of page 1 and look for the login button.
+
+    Returns True (logged in), False (logged out) or None (site unreachable).
+    """
+    try:
+        governor.acquire(SEARCH_URL, governor.ALERT)
+    except governor.BudgetExhausted:
+        return None
+    try:
+        with session.get(SEARCH_URL, params={"page": 1}, timeout=15, stream=True) as resp:
+            if resp.status_code != 200:
+                return None
+            head = b""
+            for chunk in resp.iter_content(16 * 1024):
+                head += chunk
+                if _LOGIN_MARKER in head:
+                    return False
+                if len(head) >= PROBE_BYTES:
+                    break
+            return True
+    except requests.RequestException:
+        return None
+
+
+def ensure_valid(session: requests.Session) -> bool:
+    """Check the session before a cycle; warn once and start a refresh if it is invalid."""
+    global _last_valid, _warning_sent
+    expiry = expires_at()
+    if expiry is not None and expiry < time.time():
+        valid = False  # the login itself is gone; otherwise the probe is authoritative
+    else:
+        valid = probe(session)
+        if valid is None:
+            return _last_valid is not False  # can't tell — keep the last verdict
+    _last_valid = valid
+    if valid:
+        _warning_sent = False
+        return True
+
+    print("⚠️  Cookies invalid — running in anonymous mode.")
+    refreshing = refresh_async()
+    if not _warning_sent:
+        from telegram_bot import send_message
+        hint = (
+            "Refreshing the session automatically in the background."
+            if refreshing else
+            "Run <code>python main.py --login</code> to re-authenticate."
+        )
+        try:
+            send_message(
+                "⚠️ <b>CROUS Notifier</b>: Login cookies have expired or are invalid.\n"
+                "Falling back to <b>anonymous mode</b> (fewer listings visible).\n\n"
+                + hint
+            )
+            _warning_sent = True
+        except Exception as e:
+            # Never let the warning break the sweep; it is retried next cycle
+            print(f"⚠️  Could not send the expired-session warning: {e}")
+    return False
+
+
+def _refresh() -> None:
+    from auth import login_headless
+    try:
+        login_headless(CROUS_EMAIL, CROUS_PASSWORD)
+        print("🔐 Session refreshed via headless login.")
+    except Exception as e:
+        print(f"⚠️  Headless login failed: {e}")
+
+
+def refresh_async() -> bool:
+    """Start a headless re-login unless one is running. False if no credentials are set."""
+    global _refresh_thread
+    if not CROUS_EMAIL or not CROUS_PASSWORD:
+        return False
+    with _lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(target=_refresh, daemon=True)
+            _refresh_thread.start()
+    return True
+
+
+def status() -> dict:
+    """Session summary for the status snapshot."""
+    expiry = expires_at()
+    return {
+        "valid": _last_valid,
+        "expires_at": expiry,
+        "refreshing": _refresh_thread is not None and _refresh_thread.is_alive(),
+    }
@@ -1,12 +1,38 @@
-import json
+"""
+Tracked listings, kept as an in-memory index backed by two files:
+
+- state.json — periodic snapshot (compact JSON, {id: accommodation})
+- state.log  — append-only delta records since that snapshot, one JSON
+  object per line: add / update (full entry), delete / seen (id only)
+
+Writes append only what changed; every STATE_COMPACT_EVERY records the
+index is written out as a new snapshot and the log is moved to
+state.audit.log, which keeps the history of when each listing appeared.
+Records are idempotent, so replaying a log over a newer snapshot is safe.
+Other processes pick up changes by tailing the log from their last offset.
+"""
+
 import os
+import serializer
+import threading
 import time as _time
 import requests as req
+from contextlib import contextmanager
 from datetime import datetime
-from config import STATE_FILE, HEROKU_API_KEY, HEROKU_APP_NAME
+from config import STATE_FILE, STATE_LOG_FILE, HEROKU_API_KEY, HEROKU_APP_NAME
+from models import Accommodation
+
+STATE_COMPACT_EVERY = 500       # log records before a snapshot + compaction
+AUDIT_FILE = "state.audit.log"
 
 _pulled: bool = False  # guard so _heroku_pull only runs once
 
+_lock = threading.RLock()
+_index: dict[str, Accommodation] = {}
+_snapshot_sig: tuple | None = None   # (inode, mtime_ns) of the loaded snapshot
+_log_offset = 0                      # bytes of state.log already applied
+_log_records = 0                     # records applied since the snapshot
+
 
 def _heroku_headers() -> dict:
     return {
@@ -45,64 +71,178 @@ def _heroku_push(payload: str) -> None:
     pass
 
 
-def _load_raw() -> dict:
-    _heroku_pull()  # no-op after first call; restores state.json from Heroku on fresh dyno
+@contextmanager
+def _file_lock():
+    """Serialize writers across processes (web deletes vs worker saves/compaction)."""
+    with open(STATE_LOG_FILE + ".lock", "a") as handle:
+        try:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        except ImportError:
+            pass  # no flock on this platform — thread lock only
+        yield
+
+
+def _read_snapshot() -> dict[str, Accommodation]:
     try:
-        with open(STATE_FILE, encoding="utf-8") as f:
-            data = json.load(f)
+        with open(STATE_FILE, "rb") as f:
+            data = serializer.loads(f.read())
         # Migrate old format (list of IDs) to new format (dict of id -> accommodation)
         if isinstance(data, list):
-            return {acc_id: {"id": acc_id} for acc_id in data}
-        return data
-    except (FileNotFoundError, json.JSONDecodeError):
+            return {acc_id: Accommodation(acc_id) for acc_id in data}
+        return {acc_id: Accommodation.from_dict(entry) for acc_id, entry in data.items()}
+    except (FileNotFoundError, ValueError):  # orjson and json decode errors are ValueErrors
         return {}
 
 
+def _apply(record: dict) -> None:
+    op = record.get("op")
+    if op in ("add", "update"):
+        acc = Accommodation.from_dict(record["acc"])
+        _index[acc.id] = acc
+    elif op == "delete":
+        _index.pop(record["id"], None)
+    elif op == "seen":
+        _index.setdefault(record["id"], Accommodation(record["id"]))
+
+
+def _sync() -> None:
+    """Bring the in-memory index up to date with the snapshot and log on disk."""
+    global _snapshot_sig, _log_offset, _log_records
+    _heroku_pull()  # no-op after first call; restores state.json from Heroku on fresh dyno
+    try:
+        st = os.stat(STATE_FILE)
+        sig = (st.st_ino, st.st_mtime_ns)
+    except FileNotFoundError:
+        sig = None
+    try:
+        log_size = os.path.getsize(STATE_LOG_FILE)
+    except FileNotFoundError:
+        log_size = 0
+
+    if sig != _snapshot_sig or log_size < _log_offset:
+        # New snapshot (compaction elsewhere) or truncated log: replay from scratch
+        _index.clear()
+        _index.update(_read_snapshot())
+        _snapshot_sig = sig
+        _log_offset = _log_records = 0
+    if log_size > _log_offset:
+        with open(STATE_LOG_FILE, "rb") as f:
+            f.seek(_log_offset)
+            chunk = f.read(log_size - _log_offset)
+        complete = chunk[:chunk.rfind(b"\n") + 1]  # ignore a line still being written
+        for line in complete.splitlines():
+            if line.strip():
+                try:
+                    _apply(serializer.loads(line))
+                except ValueError:
+                    continue  # torn write from a crash
+                _log_records += 1
+        _log_offset += len(complete)
+
+
+def _append(records: list[dict]) -> None:
+    """Durably append delta records, apply them, and compact when the log is long."""
+    global _log_offset, _log_records
+    if not records:
+        return
+    ts = datetime.now().isoformat(timespec="seconds")
+    data = b"".join(serializer.dumps({**r, "ts": ts}) + b"\n" for r in records)
+    with open(STATE_LOG_FILE, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    for r in records:
+        _apply(r)
+    _log_offset += len(data)
+    _log_records += len(records)
+    if _log_records >= STATE_COMPACT_EVERY:
+        _compact()
+
+
+def _compact() -> None:
+    """Write the index as a new snapshot and move the log to the audit file."""
+    global _snapshot_sig, _log_offset, _log_records
+    payload = serializer.dumps({acc_id: acc.to_dict() for acc_id, acc in _index.items()})
+    serializer.write_atomic(STATE_FILE, payload)
+    try:
+        with open(STATE_LOG_FILE, "rb") as src, open(AUDIT_FILE, "ab") as dst:
+            dst.write(src.read())
+    except FileNotFoundError:
+        pass
+    open(STATE_LOG_FILE, "wb").close()
+    st = os.stat(STATE_FILE)
+    _snapshot_sig = (st.st_ino, st.st_mtime_ns)
+    _log_offset = _log_records = 0
+    _heroku_push(payload.decode("utf-8"))
+
+
+def compact() -> None:
+    """Force a snapshot + compaction now."""
+    with _lock, _file_lock():
+        _sync()
+        _compact()
+
+
 def load_state() -> set[str]:
-    return set(_load_raw().keys())
+    with _lock:
+        _sync()
+        return set(_index)
 
 
-def load_listings() -> list[dict]:
-    """Return all tracked accommodations sorted by first_seen (newest first)."""
-    raw = _load_raw()
-    listings = list(raw.values())
-    listings.sort(key=lambda x: x.get("first_seen", ""), reverse=True)
+def load_listings() -> list[Accommodation]:
+    """Return all tracked accommodations sorted by (first_seen, id), newest first."""
+    with _lock:
+        _sync()
+        listings = list(_index.values())
+    listings.sort(key=lambda x: (x.first_seen or "", x.id), reverse=True)
     return listings
 
 
+def get_listing(acc_id: str) -> Accommodation | None:
+    with _lock:
+        _sync()
+        return _index.get(acc_id)
+
+
+def export_state(path: str) -> int:
+    """Write a pretty-printed copy of the tracked listings to path. Returns the count."""
+    with _lock:
+        _sync()
+        data = {acc_id: acc.to_dict() for acc_id, acc in _index.items()}
+    serializer.write_atomic(path, serializer.dumps(data, pretty=True))
+    return len(data)
+
+
 def delete_listing(acc_id: str) -> None:
     """Remove a single listing from tracked state."""
-    existing = _load_raw()
-    if acc_id in existing:
-        del existing[acc_id]
-        payload = json.dumps(existing, indent=2, ensure_ascii=False)
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            f.write(payload)
-        _heroku_push(payload)
+    with _lock, _file_lock():
+        _sync()
+        if acc_id in _index:
+            _append([{"op": "delete", "id": acc_id}])
 
 
 def save_state(
-        known_ids: set[str], current_accommodations: list[dict] | None = None) -> None:
-    existing = _load_raw()
-    if current_accommodations:
-        by_id = {a["id"]: a for a in current_accommodations}
-        for acc_id in known_ids:
-            if acc_id in by_id:
-                entry = dict(by_id[acc_id])
-                # Preserve original first_seen if already stored
-                if acc_id in existing and "first_seen" in existing[acc_id]:
-                    entry["first_seen"] = existing[acc_id]["first_seen"]
-                else:
-                    entry["first_seen"] = datetime.now().isoformat(timespec="seconds")
-                existing[acc_id] = entry
-            elif acc_id not in existing:
-                existing[acc_id] = {"id": acc_id}
-    else:
+        known_ids: set[str], current_accommodations: list[Accommodation] | None = None) -> None:
+    """Record new/changed listings. Only the differences are written to the log."""
+    by_id = {a.id: a for a in current_accommodations or []}
+    records: list[dict] = []
+    with _lock, _file_lock():
+        _sync()
         for acc_id in known_ids:
-            if acc_id not in existing:
-                existing[acc_id] = {"id": acc_id}
-
-    payload = json.dumps(existing, indent=2, ensure_ascii=False)
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        f.write(payload)
-    _heroku_push(payload)
+            stored = _index.get(acc_id)
+            acc = by_id.get(acc_id)
+            if acc is None:
+                if stored is None:
+                    records.append({"op": "seen", "id": acc_id})
+                continue
+            # Preserve original first_seen if already stored
+            if stored is not None and stored.first_seen:
+                acc.first_seen = stored.first_seen
+            else:
+                acc.first_seen = datetime.now().isoformat(timespec="seconds")
+            if stored is None or not stored.first_seen:
+                records.append({"op": "add", "acc": acc.to_dict()})
+            elif stored != acc:
+                records.append({"op": "update", "acc": acc.to_dict()})
+        _append(records)
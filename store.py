@@ -0,0 +1,118 @@
+"""
+Local SQLite store shared by the web and worker processes.
+
+Holds small JSON values (notifier status, city stats), the activity log and
+a command queue (web → worker). Every process/thread opens its own
+connection; WAL mode lets web readers run while the worker writes.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from config import STORE_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    line TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commands (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    name    TEXT NOT NULL,
+    payload TEXT,
+    created REAL NOT NULL
+);
+"""
+
+LOG_KEEP = 100  # same depth as the old in-memory deque
+
+_local = threading.local()
+
+
+def connection() -> sqlite3.Connection:
+    """Return this thread's connection (other modules may keep their own tables here)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STORE_FILE, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def get(key: str, default=None):
+    row = connection().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def put(key: str, value) -> None:
+    connection().execute(
+        "INSERT INTO kv (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, json.dumps(value, ensure_ascii=False)),
+    )
+
+
+def modify(key: str, fn, default=None):
+    """Atomically replace the value at key with fn(current value) and return it."""
+    conn = connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        value = fn(json.loads(row[0]) if row else default)
+        put(key, value)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return value
+
+
+def update(key: str, **fields) -> dict:
+    """Merge fields into the dict stored at key (atomically) and return the result."""
+    return modify(key, lambda value: {**value, **fields}, default={})
+
+
+def append_log(line: str) -> None:
+    conn = connection()
+    cur = conn.execute("INSERT INTO logs (line) VALUES (?)", (line,))
+    conn.execute("DELETE FROM logs WHERE id <= ?", (cur.lastrowid - LOG_KEEP,))
+
+
+def recent_logs(limit: int = LOG_KEEP) -> list[str]:
+    """Return the latest log lines, newest first."""
+    rows = connection().execute(
+        "SELECT line FROM logs ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def enqueue(name: str, payload: dict | None = None) -> None:
+    """Queue a command for the worker (start, stop, check, refresh_cities…)."""
+    connection().execute(
+        "INSERT INTO commands (name, payload, created) VALUES (?, ?, ?)",
+        (name, json.dumps(payload) if payload is not None else None, time.time()),
+    )
+
+
+def take_commands() -> list[tuple[str, dict | None]]:
+    """Pop every queued command, oldest first."""
+    conn = connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT id, name, payload FROM commands ORDER BY id"
+        ).fetchall()
+        if rows:
+            conn.execute("DELETE FROM commands WHERE id <= ?", (rows[-1][0],))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [(name, json.loads(p) if p else None) for _, name, p in rows]
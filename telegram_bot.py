@@ -1,9 +1,12 @@
 import asyncio
-import telegram
 from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 
 
 def send_message(text: str, image_url: str | None = None) -> None:
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID must be set")
+    import telegram  # python-telegram-bot is slow to import; only load it to send
+
     async def _send() -> None:
         bot = telegram.Bot(token=TELEGRAM_BOT_TOKEN)
         if image_url:
@@ -28,23 +31,17 @@ def send_message(text: str, image_url: str | None = None) -> None:
 
 
 def _build_status_message(state: dict) -> str:
-    from config import LOCATIONS, CHECK_INTERVAL_MINUTES
-    from state import load_listings
-
     running = state.get("running", False)
     last_check = state.get("last_check")
-    listing_count = state.get("listing_count", 0)
+    tracked = state.get("tracked", state.get("listing_count", 0))
     new_since = state.get("new_since_start", 0)
     use_auth = state.get("use_auth", False)
+    interval = state.get("interval", "?")
+    locations = state.get("locations") or []
     logs = state.get("logs", [])
 
-    try:
-        tracked = len(load_listings())
-    except Exception:
-        tracked = listing_count
-
     last_str = last_check.strftime("%H:%M:%S") if last_check else "Never"
-    locs = ", ".join(LOCATIONS) if LOCATIONS else "All cities"
+    locs = ", ".join(locations) if locations else "All cities"
     auth_str = "🔐 Logged-in" if use_auth else "👤 Anonymous"
     status_icon = "▶️" if running else "⏸"
 
@@ -52,7 +49,7 @@ def _build_status_message(state: dict) -> str:
         f"🤖 <b>CROUS Notifier Status</b>\n\n"
         f"{status_icon} <b>Running:</b> {'Yes' if running else 'No'}\n"
         f"🔍 <b>Last check:</b> {last_str}\n"
-        f"⏱ <b>Interval:</b> every {CHECK_INTERVAL_MINUTES} min\n"
+        f"⏱ <b>Interval:</b> every {interval} min\n"
         f"📋 <b>Tracked listings:</b> {tracked}\n"
         f"🆕 <b>New since start:</b> {new_since}\n"
         f"📍 <b>Locations:</b> {locs}\n"
@@ -66,14 +63,149 @@ def _build_status_message(state: dict) -> str:
     return msg
 
 
-def start_status_bot(state_getter) -> None:
-    """Poll Telegram for messages and reply with status. Uses plain HTTP — no asyncio."""
+# ── Command router ──────────────────────────────────────────────────────────
+# Handlers take the command argument string and return the reply messages.
+# Status comes from the snapshot the worker publishes once per cycle.
+
+def _cmd_status(arg: str) -> list[str]:
+    import store
+    from worker import get_status
+    state = get_status()
+    state["logs"] = store.recent_logs(4)
+    return [_build_status_message(state)]
+
+
+def _cmd_logs(arg: str) -> list[str]:
+    import store
+    all_logs = store.recent_logs()
+    if not all_logs:
+        return ["📜 No logs yet."]
+    # Split into ≤4000-char chunks to stay within Telegram limit
+    chunks, current = [], []
+    size = 0
+    for line in all_logs:
+        if size + len(line) + 1 > 3800:
+            chunks.append(current)
+            current, size = [line], len(line)
+        else:
+            current.append(line)
+            size += len(line) + 1
+    if current:
+        chunks.append(current)
+    return [
+        f"📜 <b>Logs ({i+1}/{len(chunks)}):</b>\n<code>" + "\n".join(c) + "</code>"
+        for i, c in enumerate(chunks)
+    ]
+
+
+def _cmd_pause(arg: str) -> list[str]:
+    import store
+    store.enqueue("stop")
+    return ["⏸ Notifier paused."]
+
+
+def _cmd_resume(arg: str) -> list[str]:
+    import store
+    store.enqueue("start")
+    return ["▶️ Notifier resumed."]
+
+
+def _cmd_check(arg: str) -> list[str]:
+    import store
+    store.enqueue("check")
+    return ["🔍 Check triggered."]
+
+
+def _cmd_subscribe(arg: str) -> list[str]:
+    import runtime_config
+    city = arg.strip().upper()
+    if not city:
+        return ["Usage: <code>/subscribe CITY</code>"]
+    locations = runtime_config.current().locations
+    if city not in locations:
+        runtime_config.update(locations=[*locations, city])
+    return [f"📍 Subscribed to <b>{city}</b> (applies from the next check)."]
+
+
+_COMMANDS = {
+    "/status": _cmd_status,
+    "/logs": _cmd_logs,
+    "/pause": _cmd_pause,
+    "/resume": _cmd_resume,
+    "/check": _cmd_check,
+    "/subscribe": _cmd_subscribe,
+}
+
+
+def _route(text: str) -> list[str]:
+    """Dispatch a message to its command handler. Plain 'logs' still works; anything else → status."""
+    cmd, _, arg = text.strip().partition(" ")
+    cmd = cmd.lower().split("@", 1)[0]  # "/status@MyBot" in group chats
+    if cmd == "logs":
+        cmd = "/logs"
+    handler = _COMMANDS.get(cmd, _cmd_status)
+    try:
+        return handler(arg)
+    except Exception as e:
+        return [f"⚠️ Command failed: {e}"]
+
+
+def _api_url() -> str:
+    return f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+
+
+def handle_update(upd: dict) -> None:
+    """Handle one Telegram update (from long polling or the webhook)."""
+    import requests as req
+
+    msg = upd.get("message")
+    if not msg:
+        return
+    chat_id = str(msg.get("chat", {}).get("id", ""))
+    if not TELEGRAM_CHAT_ID or chat_id != str(TELEGRAM_CHAT_ID):
+        return
+    for reply in _route(msg.get("text") or ""):
+        req.post(f"{_api_url()}/sendMessage", json={
+            "chat_id": TELEGRAM_CHAT_ID,
+            "text": reply,
+            "parse_mode": "HTML",
+        }, timeout=10)
+
+
+def webhook_secret() -> str:
+    """Secret Telegram echoes in X-Telegram-Bot-Api-Secret-Token on webhook calls."""
+    from config import TELEGRAM_WEBHOOK_SECRET
+    if TELEGRAM_WEBHOOK_SECRET:
+        return TELEGRAM_WEBHOOK_SECRET
+    import hashlib
+    return hashlib.sha256(TELEGRAM_BOT_TOKEN.encode()).hexdigest()[:32]
+
+
+def set_webhook(base_url: str) -> None:
+    """Point Telegram at the Flask webhook route (replaces long polling)."""
+    import requests as req
+    req.post(f"{_api_url()}/setWebhook", json={
+        "url": f"{base_url.rstrip('/')}/telegram/webhook",
+        "secret_token": webhook_secret(),
+        "allowed_updates": ["message"],
+        "drop_pending_updates": True,
+    }, timeout=10).raise_for_status()
+
+
+def start_status_bot() -> None:
+    """Poll Telegram for messages and route commands. Uses plain HTTP — no asyncio."""
     import requests as req
     import time as _t
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+    url = _api_url()
     offset = 0
 
+    # Long polling and webhooks are mutually exclusive on Telegram's side
+    try:
+        req.post(f"{url}/deleteWebhook", timeout=10)
+    except Exception:
+        pass
+
     # Skip updates that arrived before we started (drop_pending)
     try:
         r = req.get(f"{url}/getUpdates", params={"offset": -1}, timeout=10)
@@ -93,48 +225,6 @@ def start_status_bot(state_getter) -> None:
             r.raise_for_status()
             for upd in r.json().get("result", []):
                 offset = upd["update_id"] + 1
-                msg = upd.get("message")
-                if not msg:
-                    continue
-                if str(msg.get("chat", {}).get("id", "")) != str(TELEGRAM_CHAT_ID):
-                    continue
-                text = (msg.get("text") or "").strip()
-                if text.lower() == "logs":
-                    try:
-                        state = state_getter()
-                        all_logs = state.get("logs_all") or state.get("logs", [])
-                        if not all_logs:
-                            replies = ["📜 No logs yet."]
-                        else:
-                            # Split into ≤4000-char chunks to stay within Telegram limit
-                            lines = all_logs
-                            chunks, current = [], []
-                            size = 0
-                            for line in lines:
-                                if size + len(line) + 1 > 3800:
-                                    chunks.append(current)
-                                    current, size = [line], len(line)
-                                else:
-                                    current.append(line)
-                                    size += len(line) + 1
-                            if current:
-                                chunks.append(current)
-                            replies = [
-                                f"📜 <b>Logs ({i+1}/{len(chunks)}):</b>\n<code>" + "\n".join(c) + "</code>"
-                                for i, c in enumerate(chunks)
-                            ]
-                    except Exception as e:
-                        replies = [f"⚠️ Could not retrieve logs: {e}"]
-                else:
-                    try:
-                        replies = [_build_status_message(state_getter())]
-                    except Exception as e:
-                        replies = [f"⚠️ Could not retrieve status: {e}"]
-                for reply in replies:
-                    req.post(f"{url}/sendMessage", json={
-                        "chat_id": TELEGRAM_CHAT_ID,
-                        "text": reply,
-                        "parse_mode": "HTML",
-                    }, timeout=10)
+                handle_update(upd)
         except Exception:
             _t.sleep(5)
@@ -0,0 +1,140 @@
+"""
+Thumbnail proxy cache for the tracked-listings grid (/thumb/<id>).
+
+Listing images are fetched once through the request governor (enrichment
+priority), downsized to THUMB_WIDTH when Pillow is installed, and kept under
+THUMBS_DIR. The directory is an LRU cache: a hit refreshes the file's mtime,
+and the least recently used files are evicted once it grows past THUMBS_MAX_MB.
+"""
+
+import hashlib
+import io
+import os
+import threading
+
+import governor
+import serializer
+from config import THUMBS_DIR, THUMBS_MAX_MB, THUMB_WIDTH
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024   # ignore anything bigger than a listing photo
+FETCH_SLOTS = 2                     # concurrent fetches per process; the rest get 503
+
+_fetch_slots = threading.Semaphore(FETCH_SLOTS)
+_size_lock = threading.Lock()
+_cache_bytes: int | None = None     # computed on first store
+
+
+class Busy(RuntimeError):
+    """All fetch slots are taken (or the governor budget is spent); retry after retry_after s."""
+
+    def __init__(self, message: str, retry_after: int = 2):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _path(image_url: str) -> str:
+    key = hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+    return os.path.join(THUMBS_DIR, key[:2], key)
+
+
+def mimetype(data: bytes) -> str:
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"GIF8"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _downsize(data: bytes) -> bytes:
+    """Re-encode as a THUMB_WIDTH-wide JPEG; returns the original without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width <= THUMB_WIDTH:
+                return data
+            img.thumbnail((THUMB_WIDTH, THUMB_WIDTH * 4))
+            out = io.BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=80, optimize=True)
+            return out.getvalue()
+    except Exception:
+        return data  # not an image Pillow understands — serve it as-is
+
+
+def _files() -> list[os.DirEntry]:
+    entries = []
+    if not os.path.isdir(THUMBS_DIR):
+        return entries
+    for sub in os.scandir(THUMBS_DIR):
+        if sub.is_dir():
+            entries.extend(e for e in os.scandir(sub.path) if e.is_file() and not e.name.startswith("."))
+    return entries
+
+
+def _account(added: int) -> None:
+    """Track the cache size and evict least recently used files past the cap."""
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(e.stat().st_size for e in _files())
+        else:
+            _cache_bytes += added
+        limit = THUMBS_MAX_MB * 1024 * 1024
+        if _cache_bytes <= limit:
+            return
+        entries = sorted(_files(), key=lambda e: e.stat().st_mtime)
+        _cache_bytes = sum(e.stat().st_size for e in entries)
+        target = limit * 0.9  # evict a little extra so we don't prune on every store
+        for e in entries:
+            if _cache_bytes <= target:
+                break
+            try:
+                size = e.stat().st_size
+                os.unlink(e.path)
+                _cache_bytes -= size
+            except OSError:
+                pass
+
+
+def get(image_url: str) -> bytes:
+    """Return the thumbnail for image_url, fetching and caching it on a miss.
+
+    Raises Busy when it can't be fetched right now and requests.RequestException
+    when the image host fails.
+    """
+    path = _path(image_url)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # LRU: mark as recently used
+        return data
+    except FileNotFoundError:
+        pass
+
+    if not _fetch_slots.acquire(blocking=False):
+        raise Busy("thumbnail fetches in progress")
+    try:
+        import requests
+        from scraper import HEADERS
+        try:
+            governor.acquire(image_url, governor.ENRICH)
+        except governor.BudgetExhausted as e:
+            raise Busy(str(e), retry_after=300) from e
+        resp = requests.get(image_url, headers=HEADERS, timeout=15)
+        resp.raise_for_status()
+        if len(resp.content) > MAX_IMAGE_BYTES:
+            raise requests.RequestException(f"image too large ({len(resp.content)} bytes)")
+        data = _downsize(resp.content)
+    finally:
+        _fetch_slots.release()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    serializer.write_atomic(path, data)
+    _account(len(data))
+    return data
@@ -1,6 +1,8 @@
 """
 Flask web interface for controlling the CROUS Notifier.
-Runs the polling loop in a background thread.
+Stateless: status and logs come from the shared store, and start/stop/check
+are queued for the background worker (worker.py). Without a separate worker
+process, the first web process to grab the worker lock runs it in a thread.
 
 Usage:
     python main.py --web
@@ -10,16 +12,28 @@ Then open: http://localhost:5000
 import os
 import threading
 import time
-import schedule as sched
-from collections import deque
-from datetime import datetime
-from zoneinfo import ZoneInfo
 from flask import Flask, render_template, request, redirect, url_for, flash, Response
+from flask.json.provider import DefaultJSONProvider
 from functools import wraps
 
-from config import STATE_FILE, WEB_PASSWORD, PORT
+import runtime_config
+import serializer
+import store
+import worker
+from config import WEB_PASSWORD, TELEGRAM_BOT_TOKEN, TELEGRAM_WEBHOOK_URL
+
+class _FastJSONProvider(DefaultJSONProvider):
+    """Route Flask's JSON responses through serializer (orjson when installed)."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return serializer.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return serializer.loads(s)
+
 
 app = Flask(__name__)
+app.json = _FastJSONProvider(app)
 app.secret_key = os.urandom(24)
 
 
@@ -38,165 +52,74 @@ def _require_auth(f):
         return f(*args, **kwargs)
     return decorated
 
-# ── Shared state ────────────────────────────────────────────────────────────
-_lock = threading.Lock()
-_logs: deque[str] = deque(maxlen=100)
-_state = {
-    "running": False,
-    "last_check": None,       # datetime or None
-    "listing_count": 0,
-    "new_since_start": 0,
-}
-_stop_event = threading.Event()
-_thread: threading.Thread | None = None
-
-# City list cache (populated in background to avoid blocking web requests)
-_city_cache: list[str] = []
-_city_cache_lock = threading.Lock()
-
-
-def _refresh_city_cache() -> None:
-    """Scrape all CROUS cities and cache the result."""
-    global _city_cache
-    try:
-        from scraper import get_all_cities
-        cities = get_all_cities(polite_delay=False)
-        if cities:
-            with _city_cache_lock:
-                _city_cache = cities
-    except Exception as e:
-        print(f"⚠️  City cache refresh failed: {e}")
+# ── Background worker ───────────────────────────────────────────────────────
+_city_stats_version = None
+_web_ready_marked = False
 
 
-def _log(msg: str) -> None:
-    ts = datetime.now(ZoneInfo("Europe/Paris")).strftime("%H:%M:%S")
-    with _lock:
-        _logs.appendleft(f"[{ts}] {msg}")
+def _sync_city_index() -> None:
+    """Load the worker's latest city stats into the in-memory index if they changed."""
+    global _city_stats_version
+    import cities
+    version = store.get("city_stats_version")
+    if version is not None and version != _city_stats_version:
+        cities.update_live(store.get("city_stats", {}))
+        _city_stats_version = version
 
 
-def _auto_start_on_heroku() -> None:
-    """When deployed on Heroku (DYNO env var set), start the notifier automatically."""
-    if not os.getenv("DYNO"):
-        return
-    global _thread, _stop_event
-    from config import CHECK_INTERVAL_MINUTES
-    _stop_event = threading.Event()
-    _thread = threading.Thread(target=_polling_loop, args=(CHECK_INTERVAL_MINUTES,), daemon=True)
-    _thread.start()
-    # Pre-warm city cache in background
-    threading.Thread(target=_refresh_city_cache, daemon=True).start()
-    with _lock:
-        _state["running"] = True
-    _log(f"▶ Auto-started on Heroku (every {CHECK_INTERVAL_MINUTES} min).")
-    # Start Telegram status bot
-    try:
-        from telegram_bot import start_status_bot
-        def _get_state():
-            from config import USE_AUTH
-            with _lock:
-                s = dict(_state)
-                s["logs"] = list(_logs)[:4]
-                s["logs_all"] = list(_logs)
-                s["use_auth"] = USE_AUTH
-            return s
-        threading.Thread(target=start_status_bot, args=(_get_state,), daemon=True).start()
-    except Exception as e:
-        _log(f"⚠️ Telegram status bot failed to start: {e}")
-
+def _start_worker() -> None:
+    """Run the worker in this process unless a dedicated one is configured.
 
-# ── Patched notifier that writes to our log ─────────────────────────────────
-def _run_check() -> None:
-    import scraper as sc
-    from state import load_state, save_state
-    from telegram_bot import send_message
-    from notifier import _format_message
-
-    _log("🔍 Checking for new accommodations…")
-    try:
-        current = sc.fetch_all_accommodations()
-    except Exception as e:
-        _log(f"❌ Scrape failed: {e}")
+    On Heroku (DYNO env var set) the notifier starts checking immediately;
+    locally it waits for the Start button.
+    """
+    if os.getenv("SCRAPER_WORKER") == "external":
         return
-
-    known_ids = load_state()
-    current_ids = {a["id"] for a in current}
-
-    with _lock:
-        _state["last_check"] = datetime.now(ZoneInfo("Europe/Paris"))
-        _state["listing_count"] = len(current_ids)
-
-    new_items = [a for a in current if a["id"] not in known_ids]
-    if new_items:
-        _log(f"🆕 {len(new_items)} new listing(s) found!")
-        for acc in new_items:
-            try:
-                send_message(_format_message(acc), image_url=acc.get("image_url"))
-                _log(f"  ✅ Notified: {acc['name']} — {acc['address']}")
-            except Exception as e:
-                _log(f"  ❌ Telegram failed for {acc['name']}: {e}")
-        with _lock:
-            _state["new_since_start"] += len(new_items)
-        save_state(known_ids | current_ids, current)
-    else:
-        _log(f"✓ No new listings. ({len(current_ids)} tracked)")
+    worker.start_in_thread(autostart=bool(os.getenv("DYNO")))
 
 
-def _polling_loop(interval_minutes: int) -> None:
-    _run_check()
-    sched.every(interval_minutes).minutes.do(_run_check)
-    while not _stop_event.is_set():
-        sched.run_pending()
-        time.sleep(10)
-    sched.clear()
-    _log("⏹ Notifier stopped.")
+@app.after_request
+def _mark_web_ready(response):
+    global _web_ready_marked
+    if not _web_ready_marked:  # once per process: lets the worker start its warm-up
+        _web_ready_marked = True
+        store.put(worker.WEB_READY_KEY, time.time())
+    return response
 
 
 # ── Routes ──────────────────────────────────────────────────────────────────
+@app.route("/healthz")
+def healthz():
+    return {"ok": True}
+
+
 @app.route("/")
 @_require_auth
 def index():
     from state import load_state
-    with _lock:
-        state_copy = dict(_state)
-        logs_copy = list(_logs)
     try:
         known_count = len(load_state())
     except Exception:
         known_count = 0
-    env = _read_env()
     return render_template(
         "index.html",
-        state=state_copy,
-        logs=logs_copy,
+        state=worker.get_status(),
+        logs=store.recent_logs(),
         known_count=known_count,
-        env=env,
+        env=_settings_form_values(),
     )
 
 
 @app.route("/start", methods=["POST"])
 @_require_auth
 def start():
-    global _thread, _stop_event
-    with _lock:
-        if _state["running"]:
-            flash("Notifier is already running.", "warning")
-            return redirect(url_for("index"))
+    if worker.get_status()["running"]:
+        flash("Notifier is already running.", "warning")
+        return redirect(url_for("index"))
 
-    from dotenv import load_dotenv
-    load_dotenv(override=True)
-    import importlib, config, scraper
-    importlib.reload(config)
-    importlib.reload(scraper)
-
-    _stop_event = threading.Event()
-    interval = int(_read_env().get("CHECK_INTERVAL_MINUTES", "10") or "10")
-    _thread = threading.Thread(target=_polling_loop, args=(interval,), daemon=True)
-    _thread.start()
-
-    with _lock:
-        _state["running"] = True
-        _state["new_since_start"] = 0
-    _log(f"▶ Notifier started (every {interval} min).")
+    store.enqueue("start")
+    # Reflect the change right away; the worker confirms on its next tick
+    store.update("status", running=True, new_since_start=0)
     flash("Notifier started.", "success")
     return redirect(url_for("index"))
 
@@ -204,13 +127,11 @@ def start():
 @app.route("/stop", methods=["POST"])
 @_require_auth
 def stop():
-    with _lock:
-        if not _state["running"]:
-            flash("Notifier is not running.", "warning")
-            return redirect(url_for("index"))
-    _stop_event.set()
-    with _lock:
-        _state["running"] = False
+    if not worker.get_status()["running"]:
+        flash("Notifier is not running.", "warning")
+        return redirect(url_for("index"))
+    store.enqueue("stop")
+    store.update("status", running=False)
     flash("Notifier stopped.", "success")
     return redirect(url_for("index"))
 
@@ -218,7 +139,7 @@ def stop():
 @app.route("/check-now", methods=["POST"])
 @_require_auth
 def check_now():
-    threading.Thread(target=_run_check, daemon=True).start()
+    store.enqueue("check")
     flash("Manual check triggered.", "success")
     return redirect(url_for("index"))
 
@@ -227,6 +148,17 @@ def check_now():
 @_require_auth
 def settings():
     if request.method == "POST":
+        try:
+            runtime_config.update(
+                locations=request.form.get("LOCATIONS", ""),
+                check_interval_minutes=int(request.form.get("CHECK_INTERVAL_MINUTES", "10").strip() or "10"),
+                max_price=request.form.get("MAX_PRICE", "").strip(),
+                use_auth=request.form.get("USE_AUTH", "false"),
+            )
+        except ValueError:
+            flash("Interval and max price must be whole numbers.", "error")
+            return redirect(url_for("index"))
+
         new_env = {
             "TELEGRAM_BOT_TOKEN": request.form.get("TELEGRAM_BOT_TOKEN", "").strip(),
             "TELEGRAM_CHAT_ID": request.form.get("TELEGRAM_CHAT_ID", "").strip(),
@@ -235,11 +167,27 @@ def settings():
             "MAX_PRICE": request.form.get("MAX_PRICE", "").strip(),
             "USE_AUTH": request.form.get("USE_AUTH", "false"),
         }
-        _write_env(new_env)
-        if os.getenv("DYNO"):
+        # Only Telegram credentials still need a restart (bot token is read at import)
+        env = _read_env()
+        creds = {k: new_env[k] for k in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID")}
+        creds_changed = any(env.get(k, "") != v for k, v in creds.items())
+        heroku_values = None
+        if creds_changed:
+            # The restart reloads settings from config vars (crous.db is wiped): push them too
+            heroku_values = dict(creds)
+            heroku_values.update(
+                {k: v for k, v in new_env.items() if k not in creds and os.getenv(k, "") != v}
+            )
+        _write_env(new_env, heroku_values=heroku_values)
+        if creds_changed and os.getenv("DYNO"):
             flash("Settings saved — the app will restart automatically in a few seconds.", "success")
+        elif creds_changed:
+            flash("Settings saved. Restart the app to apply the new Telegram credentials.", "success")
+        elif os.getenv("DYNO"):
+            flash("Settings saved — they apply from the next check, but only until the next dyno "
+                  "restart. Set them as Heroku config vars to keep them.", "success")
         else:
-            flash("Settings saved. Restart the notifier to apply changes.", "success")
+            flash("Settings saved — they apply from the next check.", "success")
         return redirect(url_for("index"))
     return redirect(url_for("index"))
 
@@ -247,15 +195,72 @@ def settings():
 @app.route("/logs")
 @_require_auth
 def logs_json():
-    with _lock:
-        return {"logs": list(_logs)}
+    return {"logs": store.recent_logs()}
+
+
+@app.route("/metrics")
+@_require_auth
+def metrics_json():
+    """Fetch counters (requests, retries, failed pages, breaker trips) and governor wait times."""
+    import governor
+    return {
+        "fetch": store.get("status", {}).get("fetch_stats", {}),
+        "governor": governor.snapshot(),  # shared by the worker and all web processes
+    }
+
+
+LISTINGS_MAX_LIMIT = 200  # largest page /listings serves
 
 
 @app.route("/listings")
 @_require_auth
 def listings_json():
+    """Tracked listings, newest first. ?after=<cursor>&limit= returns the next page of the grid.
+
+    The cursor is the "first_seen|id" of the last listing already shown, so
+    listings added meanwhile (they sort first) never shift the next page.
+    """
     from state import load_listings
-    return {"listings": load_listings()}
+    listings = load_listings()
+    after = request.args.get("after")
+    if after:
+        cursor = tuple(after.split("|", 1))
+        listings_after = [a for a in listings if (a.first_seen or "", a.id) < cursor]
+    else:
+        listings_after = listings
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = min(max(limit, 1), LISTINGS_MAX_LIMIT)
+    page = listings_after[:limit] if limit is not None else listings_after
+    last = page[-1] if page and len(page) < len(listings_after) else None
+    return {
+        "listings": [a.to_dict() for a in page],
+        "total": len(listings),
+        "next": f"{last.first_seen or ''}|{last.id}" if last else None,
+    }
+
+
+@app.route("/thumb/<acc_id>")
+@_require_auth
+def thumb(acc_id: str):
+    """Downsized, disk-cached listing image (fetched from CROUS once)."""
+    import requests
+    import thumbs
+    from state import get_listing
+    acc = get_listing(acc_id)
+    if acc is None or not acc.image_url:
+        return Response("No image.", 404)
+    try:
+        data = thumbs.get(acc.image_url)
+    except thumbs.Busy as e:
+        return Response("Busy, retry shortly.", 503,
+                        {"Retry-After": str(e.retry_after), "Cache-Control": "no-store"})
+    except requests.RequestException:
+        return Response("Image unavailable.", 502, {"Cache-Control": "no-store"})
+    resp = Response(data, mimetype=thumbs.mimetype(data))
+    resp.headers["Cache-Control"] = "private, max-age=604800"
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 
 @app.route("/listing/<acc_id>/delete", methods=["POST"])
@@ -268,29 +273,50 @@ def delete_listing(acc_id: str):
 
 @app.route("/cities")
 def cities_json():
-    """Return merged city list: static cities.txt + live scraped cities (cached)."""
-    # Load static city list
-    static_cities: set[str] = set()
-    try:
-        with open("cities.txt", encoding="utf-8") as f:
-            for line in f:
-                c = line.strip()
-                if c:
-                    static_cities.add(c)
-    except FileNotFoundError:
-        pass
-
-    with _city_cache_lock:
-        live_cities = set(_city_cache)
-
-    all_cities = sorted(static_cities | live_cities, key=str.upper)
+    """Return merged city list: static cities.txt + live scraped cities (cached, ETag)."""
+    import cities
+    _sync_city_index()
+    body, etag = cities.payload()
+    if not cities.has_live():
+        # Cache not ready yet — ask the worker to scrape and return static list now
+        store.enqueue("refresh_cities")
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+@app.route("/cities/search")
+def cities_search():
+    """Return the top city matches for ?q= (name prefix/fuzzy, or postal code prefix)."""
+    import cities
+    _sync_city_index()
+    q = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    return {"results": cities.search(q, limit)}
+
+
+@app.route("/telegram/webhook", methods=["POST"])
+def telegram_webhook():
+    """Telegram webhook (TELEGRAM_WEBHOOK_URL). Authenticated by Telegram's secret token header."""
+    import hmac
+    from telegram_bot import webhook_secret
+    if not (TELEGRAM_WEBHOOK_URL and TELEGRAM_BOT_TOKEN):
+        return Response("Not found", 404)  # webhook mode off: no derivable secret to check
+    header = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(header, webhook_secret()):
+        return Response("Forbidden", 403)
+    update = request.get_json(silent=True) or {}
+    threading.Thread(target=_handle_update, args=(update,), daemon=True).start()
+    return {"ok": True}
 
-    if live_cities:
-        return {"cities": all_cities}
 
-    # Cache not ready yet — trigger background scrape and return static list now
-    threading.Thread(target=_refresh_city_cache, daemon=True).start()
-    return {"cities": sorted(static_cities, key=str.upper), "refreshing": True}
+def _handle_update(update: dict) -> None:
+    from telegram_bot import handle_update
+    try:
+        handle_update(update)
+    except Exception as e:
+        print(f"⚠️  Telegram update failed: {e}")
 
 
 # ── .env helpers ─────────────────────────────────────────────────────────────
@@ -318,7 +344,20 @@ def _read_env() -> dict[str, str]:
     return env
 
 
-def _write_env(values: dict[str, str]) -> None:
+def _settings_form_values() -> dict[str, str]:
+    """Current values for the settings form: .env/environment overlaid with live settings."""
+    env = _read_env()
+    live = runtime_config.current()
+    env.update(
+        LOCATIONS=",".join(live.locations),
+        CHECK_INTERVAL_MINUTES=str(live.check_interval_minutes),
+        MAX_PRICE="" if live.max_price is None else str(live.max_price),
+        USE_AUTH="true" if live.use_auth else "false",
+    )
+    return env
+
+
+def _write_env(values: dict[str, str], heroku_values: dict[str, str] | None = None) -> None:
     lines = []
     try:
         with open(".env", encoding="utf-8") as f:
@@ -346,11 +385,11 @@ def _write_env(values: dict[str, str]) -> None:
     with open(".env", "w", encoding="utf-8") as f:
         f.write("\n".join(lines) + "\n")
 
-    # On Heroku, also persist to config vars in a background thread
+    # On Heroku, also persist heroku_values to config vars in a background thread
     # (the PATCH triggers a dyno restart; running it async lets the response
     # complete before the restart kills the current worker)
-    if os.getenv("DYNO"):
-        threading.Thread(target=_push_heroku_config, args=(values,), daemon=True).start()
+    if os.getenv("DYNO") and heroku_values:
+        threading.Thread(target=_push_heroku_config, args=(heroku_values,), daemon=True).start()
 
 
 def _push_heroku_config(values: dict[str, str]) -> None:
@@ -375,5 +414,5 @@ def _push_heroku_config(values: dict[str, str]) -> None:
         print(f"⚠️  Heroku config push failed: {e}")
 
 
-# Auto-start when imported by gunicorn on Heroku
-_auto_start_on_heroku()
+# Start the background worker when imported (by gunicorn or main.py --web)
+_start_worker()
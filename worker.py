@@ -0,0 +1,254 @@
+"""
+Background worker: scraper/notifier loop, Telegram status bot and city refresher.
+
+Exactly one worker is active at a time: it holds an exclusive lock on
+WORKER_LOCK_FILE for as long as it runs. Web processes stay stateless — they
+read status and logs from the shared store (store.py) and send commands
+(start, stop, check, refresh_cities) through its queue.
+
+Usage:
+    python main.py --worker
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import store
+from config import WORKER_LOCK_FILE
+
+_TZ = ZoneInfo("Europe/Paris")
+
+WARMUP_DELAY_SECONDS = 5  # max wait for the web process's first response before scraping
+WEB_READY_KEY = "web_ready_at"  # written to the store by web.py after its first response
+
+_leader_handle = None  # kept open for the lifetime of the process
+_check_lock = threading.Lock()
+_city_lock = threading.Lock()
+
+
+def _wait_for_web(since: float) -> None:
+    """Wait up to WARMUP_DELAY_SECONDS for a web process to answer after `since`.
+
+    Web and worker are separate processes on Heroku, so the signal goes
+    through the store. A worker restarted later just waits out the delay.
+    """
+    deadline = time.monotonic() + WARMUP_DELAY_SECONDS
+    while time.monotonic() < deadline:
+        if store.get(WEB_READY_KEY, 0) >= since:
+            return
+        time.sleep(0.2)
+
+
+def acquire_leader() -> bool:
+    """Take the exclusive worker lock. Returns False if another worker holds it."""
+    global _leader_handle
+    if _leader_handle is not None:
+        return True
+    handle = open(WORKER_LOCK_FILE, "a+")
+    try:
+        import fcntl
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except ImportError:
+        pass  # no flock on this platform — assume a single process
+    except OSError:
+        handle.close()
+        return False
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    _leader_handle = handle
+    return True
+
+
+def log(msg: str) -> None:
+    ts = datetime.now(_TZ).strftime("%H:%M:%S")
+    store.append_log(f"[{ts}] {msg}")
+
+
+def get_status() -> dict:
+    """Return the notifier status as shown by the web UI and the status bot."""
+    s = {
+        "running": False,
+        "last_check": None,       # datetime or None
+        "listing_count": 0,
+        "new_since_start": 0,
+    }
+    s.update(store.get("status", {}))
+    if s["last_check"]:
+        s["last_check"] = datetime.fromisoformat(s["last_check"])
+    return s
+
+
+def _publish_settings() -> None:
+    """Record the active settings in the status snapshot read by the status bot."""
+    import runtime_config
+    settings = runtime_config.current()
+    store.update(
+        "status",
+        interval=settings.check_interval_minutes,
+        locations=list(settings.locations),
+        use_auth=settings.use_auth,
+        max_price=settings.max_price,
+        settings_version=settings.version,
+    )
+
+
+def _refresh_city_cache() -> None:
+    """Scrape all CROUS cities and publish the stats for the web processes."""
+    if not _city_lock.acquire(blocking=False):
+        return  # a refresh is already in flight
+    try:
+        from scraper import get_city_stats
+        stats = get_city_stats()
+        if stats:
+            store.put("city_stats", stats)
+            store.put("city_stats_version", time.time())
+    except Exception as e:
+        print(f"⚠️  City cache refresh failed: {e}")
+    finally:
+        _city_lock.release()
+
+
+def _run_check() -> None:
+    if not _check_lock.acquire(blocking=False):
+        log("⏳ A check is already running — skipped.")
+        return
+    try:
+        _check()
+    finally:
+        _check_lock.release()
+
+
+def _check() -> None:
+    import scraper
+    import session_manager
+    from notifier import check_and_notify
+
+    result = check_and_notify(log=log)
+    store.update(
+        "status",
+        fetch_stats=dict(scraper.fetch_stats),
+        session=session_manager.status(),
+    )
+    if result is None:
+        return
+    status = get_status()
+    store.update(
+        "status",
+        last_check=datetime.now(_TZ).isoformat(timespec="seconds"),
+        listing_count=len(result["current_ids"]),
+        tracked=len(result["known_ids"] | result["current_ids"]),
+        new_since_start=status["new_since_start"] + result["sent"],
+    )
+
+
+def _replay_pending() -> None:
+    """Deliver alerts claimed by a previous run that crashed before sending them."""
+    import ledger
+    from telegram_bot import send_message
+    try:
+        ledger.replay_pending(send_message, log=log)
+    except Exception as e:
+        log(f"⚠️ Notification replay failed: {e}")
+
+
+def _start_status_bot() -> None:
+    from config import TELEGRAM_BOT_TOKEN, TELEGRAM_WEBHOOK_URL
+    if not TELEGRAM_BOT_TOKEN:
+        return
+    try:
+        from telegram_bot import set_webhook, start_status_bot
+        if TELEGRAM_WEBHOOK_URL:
+            set_webhook(TELEGRAM_WEBHOOK_URL)
+        else:
+            threading.Thread(target=start_status_bot, daemon=True).start()
+    except Exception as e:
+        log(f"⚠️ Telegram status bot failed to start: {e}")
+
+
+def _warm_up() -> None:
+    """First cycle after boot: scrape, then status bot, then the full city scrape."""
+    _run_check()
+    _start_status_bot()
+    _refresh_city_cache()
+
+
+def _spawn(target) -> None:
+    threading.Thread(target=target, daemon=True).start()
+
+
+def run(autostart: bool = False) -> None:
+    """Worker main loop. Must be called by the process holding the leader lock."""
+    import schedule
+    import runtime_config
+
+    started = time.time()
+    scheduler = schedule.Scheduler()
+    scheduled_interval: int | None = None
+    settings_version = None
+    store.update("status", running=False)
+    _publish_settings()
+
+    def _schedule(interval: int) -> None:
+        nonlocal scheduled_interval
+        scheduler.clear()
+        scheduler.every(interval).minutes.do(_spawn, _run_check)
+        scheduled_interval = interval
+
+    def _start(first_run=_run_check) -> int:
+        interval = runtime_config.current().check_interval_minutes
+        _schedule(interval)
+        store.update("status", running=True, new_since_start=0)
+        _spawn(first_run)
+        return interval
+
+    if autostart:
+        # Staged warm-up: HTTP first, then the first scrape, then the rest
+        _wait_for_web(started)
+    _replay_pending()  # before any check can claim new alerts
+    if autostart:
+        interval = _start(first_run=_warm_up)
+        log(f"▶ Auto-started on Heroku (every {interval} min).")
+
+    while True:
+        try:
+            for name, payload in store.take_commands():
+                if name == "start":
+                    interval = _start()
+                    log(f"▶ Notifier started (every {interval} min).")
+                elif name == "stop":
+                    scheduler.clear()
+                    scheduled_interval = None
+                    store.update("status", running=False)
+                    log("⏹ Notifier stopped.")
+                elif name == "check":
+                    _spawn(_run_check)
+                elif name == "refresh_cities":
+                    _spawn(_refresh_city_cache)
+
+            # Settings edits apply live: reschedule if the interval changed
+            settings = runtime_config.current()
+            if settings.version != settings_version:
+                settings_version = settings.version
+                _publish_settings()
+                if scheduled_interval is not None \
+                        and settings.check_interval_minutes != scheduled_interval:
+                    _schedule(settings.check_interval_minutes)
+                    log(f"⏱ Interval changed to every {scheduled_interval} min.")
+            scheduler.run_pending()
+        except Exception as e:
+            # e.g. "database is locked" — this loop is the only scraper, keep it alive
+            print(f"⚠️  Worker loop error: {e}")
+        time.sleep(2)
+
+
+def start_in_thread(autostart: bool = False) -> bool:
+    """Run the worker inside this process if no other worker holds the lock."""
+    if not acquire_leader():
+        return False
+    threading.Thread(target=run, args=(autostart,), daemon=True).start()
+    return True